@@ -0,0 +1,58 @@
+import aiohttp
+import asyncio
+from contextlib import nullcontext
+from typing import Tuple
+
+
+class BaseMusicAPI:
+    """
+    音乐源适配器的公共部分
+    管理保活的 aiohttp session、预建连接和按接口的请求超时，各音乐源的适配器继承此类
+    """
+
+    BASE_URL = ""
+    SOURCE = ""
+    # 预热时额外预建连接的服务器
+    WARM_UP_URLS: Tuple[str, ...] = ()
+    # 未启用自适应超时时的请求超时（秒）
+    DEFAULT_TIMEOUT = 15
+
+    def __init__(self, **kwargs):
+        self.session = None
+        self.API_URL = kwargs.get("api_url")
+        self.API_KEY = kwargs.get("api_key")
+        # 按接口的自适应超时（utils.timeouts.AdaptiveTimeouts），由插件传入
+        self.timeouts = kwargs.get("timeouts")
+
+    async def get_session(self):
+        """获取或创建 aiohttp session"""
+        if self.session is None or self.session.closed:
+            # 延长连接保活和 DNS 缓存时间，使预热建立的连接能被后续请求复用
+            connector = aiohttp.TCPConnector(keepalive_timeout=60, ttl_dns_cache=300)
+            self.session = aiohttp.ClientSession(connector=connector)
+        return self.session
+
+    async def warm_up(self):
+        """预建到各个服务器的连接"""
+        session = await self.get_session()
+
+        async def _touch(url):
+            try:
+                async with session.head(url, allow_redirects=False) as resp:
+                    await resp.release()
+            except Exception as e:
+                print(f"预建连接失败: {url}, 错误: {e}")
+
+        urls = [self.BASE_URL, *self.WARM_UP_URLS, self.API_URL]
+        await asyncio.gather(*[_touch(url) for url in urls if url])
+
+    async def close(self):
+        """关闭 aiohttp session"""
+        if self.session and not self.session.closed:
+            await self.session.close()
+
+    def _timeout(self, endpoint: str):
+        """请求超时上下文，给出超时时间（秒）并记录接口耗时"""
+        if self.timeouts is None:
+            return nullcontext(self.DEFAULT_TIMEOUT)
+        return self.timeouts.measure(f"{self.SOURCE}:{endpoint}")
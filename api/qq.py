@@ -7,12 +7,27 @@ import re
 import html
 from typing import Dict, List, Optional, Union
 
+try:
+    from .base import BaseMusicAPI
+except ImportError:  # 直接运行本文件测试时
+    from base import BaseMusicAPI
 
-class QQMusicAPI:
+
+class QQMusicAPI(BaseMusicAPI):
     BASE_URL = "https://u.y.qq.com"
+    SOURCE = "qq"
+    IKUN_SOURCE = "tx"
+    CARD_TYPE = "qq"
+    CAPABILITIES = {
+        "search": ("music", "album", "artist", "playlist"),
+        "batch_details": False,
+        "lyrics": False,
+        "card_metadata_remote": False,
+    }
+    WARM_UP_URLS = ("https://c.y.qq.com",)
 
     def __init__(self, **kwargs):
-        self.session = None
+        super().__init__(**kwargs)
         self.page_size = kwargs.get("page_size", 20)
         self.common_headers = {
             "referer": "https://y.qq.com",
@@ -41,19 +56,6 @@ class QQMusicAPI:
             "ape": {"s": "A000", "e": ".ape"},
             "flac": {"s": "F000", "e": ".flac"},
         }
-        self.API_URL = kwargs.get("api_url")
-        self.API_KEY = kwargs.get("api_key")
-
-    async def get_session(self):
-        """获取或创建 aiohttp session"""
-        if self.session is None or self.session.closed:
-            self.session = aiohttp.ClientSession()
-        return self.session
-
-    async def close(self):
-        """关闭 aiohttp session"""
-        if self.session and not self.session.closed:
-            await self.session.close()
 
     def format_music_item(self, item: dict) -> dict:
         """格式化音乐项目"""
@@ -118,7 +120,18 @@ class QQMusicAPI:
         new_query = urllib.parse.urlencode(query_dict, doseq=True)
         return urllib.parse.urlunparse(parsed._replace(query=new_query))
 
-    async def _request(self, url: str, method: str = "GET", data: dict = None, headers: dict = None):
+    @staticmethod
+    def strip_jsonp(text: str) -> str:
+        """去掉 JSONP 回调包装，只检查首尾，不扫描整个响应"""
+        text = text.strip()
+        if text[:1] in ("{", "["):
+            return text
+        start = text.find("(")
+        if start != -1 and text.endswith(")"):
+            return text[start + 1:-1]
+        return text
+
+    async def _request(self, url: str, method: str = "GET", data: dict = None, headers: dict = None, endpoint: str = "default"):
         """统一请求接口"""
         session = await self.get_session()
         request_headers = self.common_headers.copy()
@@ -126,24 +139,22 @@ class QQMusicAPI:
             request_headers.update(headers)
             
         try:
-            if method.upper() == "POST":
-                async with session.post(url, json=data, headers=request_headers) as response:
-                    text = await response.text()
-                    # 处理可能的JSONP格式
-                    text = re.sub(r'callback\(|MusicJsonCallback\(|jsonCallback\(|\)$', '', text)
-                    try:
-                        return json.loads(text)
-                    except:
-                        return {}
-            else:
-                async with session.get(url, headers=request_headers) as response:
-                    text = await response.text()
-                    # 处理可能的JSONP格式
-                    text = re.sub(r'callback\(|MusicJsonCallback\(|jsonCallback\(|\)$', '', text)
-                    try:
-                        return json.loads(text)
-                    except:
-                        return {}
+            with self._timeout(endpoint) as timeout:
+                client_timeout = aiohttp.ClientTimeout(total=timeout)
+                if method.upper() == "POST":
+                    async with session.post(url, json=data, headers=request_headers, timeout=client_timeout) as response:
+                        text = await response.text()
+                else:
+                    async with session.get(url, headers=request_headers, timeout=client_timeout) as response:
+                        text = await response.text()
+            text = self.strip_jsonp(text)
+            try:
+                return json.loads(text)
+            except:
+                return {}
+        except asyncio.TimeoutError:
+            print(f"请求超时: {url}")
+            return {}
         except Exception as e:
             print(f"请求失败: {url}, 错误: {e}")
             return {}
@@ -181,14 +192,19 @@ class QQMusicAPI:
         
         session = await self.get_session()
         try:
-            async with session.get(url, params=params, headers=self.common_headers) as response:
-                text = await response.text()
-                # 处理可能的JSONP格式
-                text = re.sub(r'callback\(|MusicJsonCallback\(|jsonCallback\(|\)$', '', text)
-                try:
-                    response_data = json.loads(text)
-                except:
-                    return {"isEnd": True, "data": []}
+            with self._timeout("search") as timeout:
+                async with session.get(
+                    url, params=params, headers=self.common_headers, timeout=aiohttp.ClientTimeout(total=timeout)
+                ) as response:
+                    text = await response.text()
+            text = self.strip_jsonp(text)
+            try:
+                response_data = json.loads(text)
+            except:
+                return {"isEnd": True, "data": []}
+        except asyncio.TimeoutError:
+            print(f"搜索请求超时: {query}")
+            return {"isEnd": True, "data": []}
         except Exception as e:
             print(f"搜索请求失败: {e}")
             return {"isEnd": True, "data": []}
@@ -294,17 +310,21 @@ class QQMusicAPI:
         if not self.API_KEY:
             raise ValueError("API_KEY 未配置")
 
-        url = f"{self.API_URL}/url?source=tx&songId={song_id}&quality={quality_param}"
+        url = f"{self.API_URL}/url?source={self.IKUN_SOURCE}&songId={song_id}&quality={quality_param}"
         headers = {
             "X-Request-Key": self.API_KEY,
         }
         
         session = await self.get_session()
         try:
-            async with session.get(url, headers=headers) as resp:
-                resp.raise_for_status()
-                result = await resp.json()
-                return {"url": result.get("url")}
+            with self._timeout("url") as timeout:
+                async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+                    resp.raise_for_status()
+                    result = await resp.json()
+                    return {"url": result.get("url")}
+        except asyncio.TimeoutError:
+            print(f"获取播放链接超时: {song_id}")
+            return {"url": None}
         except Exception as e:
             print(f"获取播放链接失败: {e}")
             return {"url": None}
@@ -336,7 +356,7 @@ class QQMusicAPI:
             "https://u.y.qq.com/cgi-bin/musicu.fcg?g_tk=5381&format=json&inCharset=utf8&outCharset=utf-8"
         )
         
-        response = await self._request(url)
+        response = await self._request(url, endpoint="album")
         song_list = response.get("albumSonglist", {}).get("data", {}).get("songList", [])
         
         return {
@@ -370,21 +390,31 @@ class QQMusicAPI:
         
         session = await self.get_session()
         try:
-            async with session.get(url, headers=headers) as response:
-                text = await response.text()
-                # 移除jsonp回调
-                text = re.sub(r'callback\(|MusicJsonCallback\(|jsonCallback\(|\)$', '', text)
-                
-                try:
-                    result = json.loads(text)
-                    song_list = result.get("cdlist", [{}])[0].get("songlist", [])
-                    return [self.format_music_item(song) for song in song_list]
-                except:
-                    return []
+            with self._timeout("playlist") as timeout:
+                async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                    text = await response.text()
+            text = self.strip_jsonp(text)
+            
+            try:
+                result = json.loads(text)
+                song_list = result.get("cdlist", [{}])[0].get("songlist", [])
+                return [self.format_music_item(song) for song in song_list]
+            except:
+                return []
+        except asyncio.TimeoutError:
+            print(f"导入歌单超时: {sheet_id}")
+            return []
         except Exception as e:
             print(f"导入歌单失败: {e}")
             return []
 
+    async def card_metadata(self, song: dict) -> dict:
+        """音乐卡片所需的链接和封面，直接由搜索结果生成"""
+        return {
+            "link": f"https://y.qq.com/n/ryqq/songDetail/{song['id']}",
+            "cover": song.get("artwork"),
+        }
+
     async def fetch_extra(self, song_id: str):
         """获取额外信息 - 使用songmid"""
         # QQ音乐可能需要不同的API来获取额外信息
@@ -4,11 +4,15 @@ import base64
 import json
 import random
 import string
-
-from Crypto.Cipher import AES
-from Crypto.Util.Padding import pad
+from collections import OrderedDict
+from typing import Dict, List
 import binascii
 
+try:
+    from .base import BaseMusicAPI
+except ImportError:  # 直接运行本文件测试时
+    from base import BaseMusicAPI
+
 
 class NetEaseCrypto:
     iv = b"0102030405060708"
@@ -26,6 +30,10 @@ class NetEaseCrypto:
     @classmethod
     def aes_encrypt(cls, text: str, sec_key: str) -> str:
         # AES-128-CBC加密，text utf-8编码，pkcs7填充，sec_key utf-8编码
+        # pycryptodome 在首次加密时才导入，使用QQ音乐源时不加载
+        from Crypto.Cipher import AES
+        from Crypto.Util.Padding import pad
+
         text_bytes = text.encode('utf-8')
         sec_key_bytes = sec_key.encode('utf-8')
         cipher = AES.new(sec_key_bytes, AES.MODE_CBC, iv=cls.iv)
@@ -59,11 +67,24 @@ class NetEaseCrypto:
         }
 
 
-class NetEaseMusicAPI:
+class NetEaseMusicAPI(BaseMusicAPI):
     BASE_URL = "https://music.163.com"
+    SOURCE = "wy"
+    IKUN_SOURCE = "wy"
+    CARD_TYPE = "163"
+    CAPABILITIES = {
+        "search": ("music", "album", "artist", "playlist"),
+        "batch_details": True,
+        "lyrics": False,
+        "card_metadata_remote": True,
+    }
+    # 单次批量查询歌曲详情的最大数量
+    DETAIL_BATCH_SIZE = 500
+    # 歌曲详情缓存的最大条目数
+    DETAIL_CACHE_SIZE = 2048
 
     def __init__(self, **kwargs):
-        self.session = None
+        super().__init__(**kwargs)
         self.common_headers = {
             "authority": "music.163.com",
             "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
@@ -79,25 +100,35 @@ class NetEaseMusicAPI:
             "accept-language": "zh-CN,zh;q=0.9",
         }
         self.page_size = kwargs.get("page_size", 5)
-        self.API_URL = kwargs.get("api_url")
-        self.API_KEY = kwargs.get("api_key")
         self.quality_levels = {
             "low": "128k",
             "standard": "320k",
             "high": "flac",
             "super": "hires",
         }
+        # 歌曲详情批量查询：在时间窗口内合并并发请求，结果按歌曲ID缓存
+        self.detail_batch_window = kwargs.get("detail_batch_window", 0.02)
+        self._detail_cache: "OrderedDict[str, dict]" = OrderedDict()
+        self._detail_futures: Dict[str, asyncio.Future] = {}
+        self._detail_queue: List[str] = []
+        self._detail_flush_task = None
 
-    async def get_session(self):
-        """获取或创建 aiohttp session"""
-        if self.session is None or self.session.closed:
-            self.session = aiohttp.ClientSession()
-        return self.session
+    async def warm_up(self):
+        """预建到各个服务器的连接"""
+        # 预先完成一次加密，避免首个请求承担冷启动开销
+        NetEaseCrypto.encrypt("{}")
+        await super().warm_up()
 
     async def close(self):
         """关闭 aiohttp session"""
-        if self.session and not self.session.closed:
-            await self.session.close()
+        if self._detail_flush_task and not self._detail_flush_task.done():
+            self._detail_flush_task.cancel()
+        for future in self._detail_futures.values():
+            if not future.done():
+                future.set_result(None)
+        self._detail_futures.clear()
+        self._detail_queue.clear()
+        await super().close()
 
     async def _request(
         self,
@@ -106,34 +137,40 @@ class NetEaseMusicAPI:
         headers: dict = {},
         cookies: dict = None,
         method: str = "GET",
+        endpoint: str = "default",
     ):
         """统一请求接口"""
         session = await self.get_session()
         
         try:
-            if method.upper() == "POST":
-                async with session.post(
-                    url, headers=headers, cookies=cookies, data=data
-                ) as response:
-                    if response.headers.get("Content-Type") == "application/json":
-                        return await response.json()
-                    else:
-                        return json.loads(await response.text())
-
-            elif method.upper() == "GET":
-                async with session.get(
-                    url, headers=headers, cookies=cookies
-                ) as response:
-                    content_type = response.content_type or "application/json"
-                    return await response.json(content_type=content_type)
-            else:
-                raise ValueError("不支持的请求方式")
+            with self._timeout(endpoint) as timeout:
+                client_timeout = aiohttp.ClientTimeout(total=timeout)
+                if method.upper() == "POST":
+                    async with session.post(
+                        url, headers=headers, cookies=cookies, data=data, timeout=client_timeout
+                    ) as response:
+                        if response.headers.get("Content-Type") == "application/json":
+                            return await response.json()
+                        else:
+                            return json.loads(await response.text())
+
+                elif method.upper() == "GET":
+                    async with session.get(
+                        url, headers=headers, cookies=cookies, timeout=client_timeout
+                    ) as response:
+                        content_type = response.content_type or "application/json"
+                        return await response.json(content_type=content_type)
+                else:
+                    raise ValueError("不支持的请求方式")
+        except asyncio.TimeoutError:
+            print(f"请求超时: {url}")
+            return {}
         except Exception as e:
             print(f"请求失败: {url}, 错误: {e}")
             return {}
 
-    async def _post(self, url: str, data: dict):
-        return await self._request(url, headers=self.common_headers, data=data, method="POST")
+    async def _post(self, url: str, data: dict, endpoint: str = "default"):
+        return await self._request(url, headers=self.common_headers, data=data, method="POST", endpoint=endpoint)
 
     async def search_base(self, query: str, page: int, search_type: int):
         data = {
@@ -145,7 +182,7 @@ class NetEaseMusicAPI:
         }
         text = json.dumps(data)
         encrypted_data = NetEaseCrypto.encrypt(text)
-        return await self._post(f"{self.BASE_URL}/weapi/search/get", encrypted_data)
+        return await self._post(f"{self.BASE_URL}/weapi/search/get", encrypted_data, endpoint="search")
 
     async def search_music(self, query: str, page: int):
         try:
@@ -155,7 +192,7 @@ class NetEaseMusicAPI:
                     "id": song["id"],
                     "title": song["name"],
                     "artist": "、".join([artist["name"] for artist in song["artists"]]),
-                    "album": song["al"]["name"] if "al" in song else None,
+                    "album": (song.get("al") or song.get("album") or {}).get("name"),
                     "artwork": song["al"]["picUrl"] if "al" in song and "picUrl" in song["al"] else None,
                     "duration": song["duration"]
                 }
@@ -269,45 +306,129 @@ class NetEaseMusicAPI:
         if not self.API_KEY:
             raise ValueError("API_KEY 未配置")
 
-        url = f"{self.API_URL}/url?source=wy&songId={song_id}&quality={quality_param}"
+        url = f"{self.API_URL}/url?source={self.IKUN_SOURCE}&songId={song_id}&quality={quality_param}"
         headers = {
             "X-Request-Key": self.API_KEY,
         }
         
         session = await self.get_session()
         try:
-            async with session.get(url, headers=headers) as resp:
-                resp.raise_for_status()
-                result = await resp.json()
-                return {"url": result.get("url")}
+            with self._timeout("url") as timeout:
+                async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+                    resp.raise_for_status()
+                    result = await resp.json()
+                    return {"url": result.get("url")}
+        except asyncio.TimeoutError:
+            print(f"获取播放链接超时: {song_id}")
+            return {"url": None}
         except Exception as e:
             print(f"获取播放链接失败: {e}")
             return {"url": None}
         
+    @staticmethod
+    def format_song_detail(song: dict) -> dict:
+        """格式化歌曲详情"""
+        album = song.get("al") or {}
+        return {
+            "title": song.get("name", ""),
+            "artist": "、".join([artist.get("name", "") for artist in song.get("ar", [])]),
+            "album": album.get("name", ""),
+            "cover": album.get("picUrl", ""),
+            "link": f"{NetEaseMusicAPI.BASE_URL}/#/song?id={song.get('id')}",
+        }
+
+    async def _fetch_song_details(self, song_ids: List[str]) -> Dict[str, dict]:
+        """一次请求批量获取歌曲详情"""
+        data = {
+            "c": json.dumps([{"id": int(song_id)} for song_id in song_ids]),
+            "ids": json.dumps([int(song_id) for song_id in song_ids]),
+            "csrf_token": "",
+        }
+        encrypted_data = NetEaseCrypto.encrypt(json.dumps(data))
+        res = await self._post(f"{self.BASE_URL}/weapi/v3/song/detail", encrypted_data, endpoint="detail")
+        return {
+            str(song["id"]): self.format_song_detail(song)
+            for song in res.get("songs", [])
+            if "id" in song
+        }
+
+    async def _flush_song_details(self):
+        """等待批量窗口结束后，合并发送排队中的歌曲详情请求"""
+        while self._detail_queue:
+            await asyncio.sleep(self.detail_batch_window)
+            queue, self._detail_queue = self._detail_queue, []
+            for i in range(0, len(queue), self.DETAIL_BATCH_SIZE):
+                chunk = queue[i:i + self.DETAIL_BATCH_SIZE]
+                try:
+                    details = await self._fetch_song_details(chunk)
+                except Exception as e:
+                    print(f"批量获取歌曲详情失败: {e}")
+                    details = {}
+                for song_id in chunk:
+                    info = details.get(song_id)
+                    if info:
+                        self._detail_cache[song_id] = info
+                        if len(self._detail_cache) > self.DETAIL_CACHE_SIZE:
+                            self._detail_cache.popitem(last=False)
+                    future = self._detail_futures.pop(song_id, None)
+                    if future and not future.done():
+                        future.set_result(info)
+
+    async def get_song_details(self, song_ids: List[str]) -> Dict[str, dict]:
+        """
+        批量获取歌曲详情（封面、链接等）
+        同一时间窗口内的并发调用会被合并为一次请求，结果按歌曲ID缓存
+        :param song_ids: 歌曲ID列表
+        :return: dict, 歌曲ID -> 详情，获取失败的ID不包含在内
+        """
+        loop = asyncio.get_running_loop()
+        result = {}
+        waiting = {}
+        for song_id in map(str, song_ids):
+            if song_id in self._detail_cache:
+                self._detail_cache.move_to_end(song_id)
+                result[song_id] = self._detail_cache[song_id]
+                continue
+            future = self._detail_futures.get(song_id)
+            if future is None:
+                future = loop.create_future()
+                self._detail_futures[song_id] = future
+                self._detail_queue.append(song_id)
+            waiting[song_id] = future
+
+        if self._detail_queue and (self._detail_flush_task is None or self._detail_flush_task.done()):
+            self._detail_flush_task = loop.create_task(self._flush_song_details())
+
+        for song_id, future in waiting.items():
+            info = await asyncio.shield(future)
+            if info:
+                result[song_id] = info
+        return result
+
+    async def card_metadata(self, song: dict) -> dict:
+        """获取音乐卡片所需的链接和封面"""
+        info = await self.fetch_extra(str(song["id"]))
+        return {"link": info["link"], "cover": info["cover"] or song.get("artwork")}
+
     async def fetch_extra(self, song_id):
         """
         获取额外信息
         """
         try:
-            url = f"https://api.paugram.com/netease/?id={song_id}"
-            result = await self._request(url)
-            return {
-                "title": result.get("title"),
-                "artist": result.get("artist"),
-                "album": result.get("album"),
-                "cover": result.get("cover"),
-                "link": result.get("link"),
-            }
+            details = await self.get_song_details([song_id])
+            info = details.get(str(song_id))
+            if info:
+                return info
         except Exception as e:
             print(f"获取额外信息失败: {e}")
-            return {
-                "title": "",
-                "artist": "",
-                "album": "",
-                "cover": "",
-                "link": "",
-            }
-    
+        return {
+            "title": "",
+            "artist": "",
+            "album": "",
+            "cover": "",
+            "link": f"{self.BASE_URL}/#/song?id={song_id}",
+        }
+
 
 # 示例测试方法：
 
@@ -1,14 +1,26 @@
+import aiohttp
 import asyncio
+import importlib
+import json
+import time
 from pathlib import Path
 import traceback
+from urllib.parse import urlparse
 from astrbot.api.event import filter, AstrMessageEvent, MessageEventResult
 from astrbot.api.star import Context, Star, register
 from astrbot.api import logger
 from astrbot.core.config.astrbot_config import AstrBotConfig
 from astrbot.core.message.components import Record
-from astrbot.core.platform.sources.aiocqhttp.aiocqhttp_message_event import AiocqhttpMessageEvent
-from astrbot.core.platform.sources.wechatpadpro.wechatpadpro_message_event import WeChatPadProMessageEvent
 import astrbot.api.message_components as Comp
+from .utils.cache_backend import Cache, MemoryBackend, create_backend
+from .utils.topk import HotSongs
+from .utils.scheduler import PriorityScheduler, INTERACTIVE, SEARCH, PREFETCH, BULK
+from .utils.play_queue import PlayQueueManager
+from .utils.render import MessageRenderer, format_time
+from .utils.trace import Tracer, current_trace, span
+from .utils.sources import SOURCE_NAMES, load_source, supports
+from .utils.timeouts import AdaptiveTimeouts
+from .utils.watchdog import LoopWatchdog
 from astrbot.core.utils.session_waiter import (
     session_waiter,
     SessionController,
@@ -16,15 +28,34 @@ from astrbot.core.utils.session_waiter import (
 
 
 SAVED_SONGS_DIR = Path("data", "plugins_data", "astrbot_plugin_ikun_music", "songs")
-SAVED_SONGS_DIR.mkdir(parents=True, exist_ok=True)
+COVERS_DIR = Path("data", "plugins_data", "astrbot_plugin_ikun_music", "covers")
+CACHE_SNAPSHOT_FILE = Path("data", "plugins_data", "astrbot_plugin_ikun_music", "cache_snapshot.json")
+AUDIO_CACHE_DIR = Path("data", "plugins_data", "astrbot_plugin_ikun_music", "audio")
+CACHE_DB_FILE = Path("data", "plugins_data", "astrbot_plugin_ikun_music", "cache.db")
+TRACE_FILE = Path("data", "plugins_data", "astrbot_plugin_ikun_music", "traces.jsonl")
+HOT_SONGS_FILE = Path("data", "plugins_data", "astrbot_plugin_ikun_music", "hot_songs.json")
+
+# 平台消息事件类按需导入，避免加载插件时导入未使用的平台适配器
+PLATFORM_EVENT_CLASSES = {
+    "aiocqhttp": ("astrbot.core.platform.sources.aiocqhttp.aiocqhttp_message_event", "AiocqhttpMessageEvent"),
+    "wechatpadpro": ("astrbot.core.platform.sources.wechatpadpro.wechatpadpro_message_event", "WeChatPadProMessageEvent"),
+}
+
+
+def is_platform_event(event: AstrMessageEvent, platform: str) -> bool:
+    """判断事件是否为指定平台的消息事件"""
+    module_name, class_name = PLATFORM_EVENT_CLASSES[platform]
+    try:
+        module = importlib.import_module(module_name)
+    except ImportError:
+        return False
+    return isinstance(event, getattr(module, class_name))
+
 
 @register("ikun_music", "IMZCC", "基于 IKUN 音源的音乐插件", "1.0.0", "https://github.com/IMZCC/astrbot_plugin_ikun_music")
 class MyPlugin(Star):
-    # 支持的音乐源
-    SUPPORTED_SOURCES = {
-        "wy": "网易云音乐",
-        "qq": "QQ音乐"
-    }
+    # 支持的音乐源，来自 utils/sources.py 的注册表
+    SUPPORTED_SOURCES = SOURCE_NAMES
     
     def __init__(self, context: Context, config: AstrBotConfig):
         super().__init__(context)
@@ -34,24 +65,273 @@ class MyPlugin(Star):
         self.send_mode = config.get("send_mode", "text")  # 默认发送模式为卡片
         self.music_source = config.get("music_source", "wy")  # 默认音乐源为wy
         self.page_size = config.get("page_size", 5)  # 默认每页显示5首歌曲
+        self.cover_size = config.get("cover_size", 0)  # 卡片封面尺寸，0 表示直接使用原图链接
+        
+        # 封面缓存：卡片封面由接收消息的 QQ 客户端下载，缩放后的封面只能经公网可访问的固定地址提供
+        self.cover_base_url = config.get("cover_base_url", "").rstrip("/")
+        self.covers = None
+        if self.cover_size > 0:
+            from .utils.cover import CoverCache, Image
+            if Image is None:
+                logger.warning("未安装 Pillow，无法缩放封面，卡片使用原图链接")
+            elif not self.cover_base_url or not config.get("audio_proxy_port", 0):
+                logger.warning("未配置封面公网地址 cover_base_url 或固定端口 audio_proxy_port，卡片使用原图链接")
+            else:
+                self.covers = CoverCache(COVERS_DIR, sizes=(self.cover_size,))
+        
+        # 本地音频中转，语音模式下边下载边转发并缓存到磁盘；同一个 HTTP 服务也提供缩放后的卡片封面
+        self.relay_audio = config.get("audio_proxy", False)
+        self.audio_proxy = None
+        if self.relay_audio or self.covers:
+            from .utils.audio_proxy import AudioProxy
+            public_host = config.get("audio_proxy_host", "")
+            self.audio_proxy = AudioProxy(
+                AUDIO_CACHE_DIR,
+                # 填写了对外地址或提供封面时监听所有网卡，供其他主机、容器中的平台适配器或反向代理访问
+                host="0.0.0.0" if public_host or self.covers else "127.0.0.1",
+                port=config.get("audio_proxy_port", 0),
+                public_host=public_host,
+                static_dirs={"cover": COVERS_DIR} if self.covers else None,
+            )
+        
+        # 上游接口的自适应超时，按各接口最近的响应耗时估计
+        self.timeouts = AdaptiveTimeouts(
+            floor=config.get("request_timeout_floor", 1.0),
+            ceiling=config.get("request_timeout_ceiling", 15.0),
+            k=config.get("request_timeout_k", 4.0),
+        )
+        
+        # 搜索结果、播放链接、歌曲信息缓存
+        # memory 为进程内缓存；sqlite/redis 可在多个实例间共享，并保证同一个键只有一个实例请求上游
+        self.cache_backend = config.get("cache_backend", "memory")
+        shared_backend = None
+        if self.cache_backend != "memory":
+            shared_backend = create_backend(
+                self.cache_backend,
+                sqlite_path=CACHE_DB_FILE,
+                redis_url=config.get("redis_url"),
+                timeouts=self.timeouts,
+            )
+        self.search_cache = Cache(shared_backend or MemoryBackend(512), "search", ttl=config.get("search_cache_ttl", 3600), logger=logger)
+        self.url_cache = Cache(shared_backend or MemoryBackend(1024), "url", ttl=config.get("url_cache_ttl", 600), logger=logger)
+        self.extra_cache = Cache(shared_backend or MemoryBackend(2048), "extra", ttl=86400, logger=logger)
+        
+        # 出站请求调度：用户选歌优先于搜索，搜索优先于预取和批量任务
+        self.scheduler = PriorityScheduler(total=config.get("max_concurrency", 8))
+        
+        # 群点歌队列，提前下载队首歌曲
+        self.play_queue = PlayQueueManager(
+            SAVED_SONGS_DIR,
+            self._download_song,
+            lookahead=config.get("queue_lookahead", 2),
+            logger=logger,
+        )
+        
+        # 请求追踪，慢请求写入 JSONL 文件
+        self.tracer = Tracer(
+            TRACE_FILE,
+            slow_threshold=config.get("trace_slow_threshold", 3.0),
+            sample_rate=config.get("trace_sample_rate", 0.0),
+        )
+        # 进行中的慢请求写入任务，保留引用避免任务被回收
+        self._trace_writes = set()
+        
+        # 消息渲染，缓存每首歌曲渲染好的文本片段
+        self.renderer = MessageRenderer()
+        
+        # 事件循环看门狗，记录事件循环延迟和阻塞事件循环的代码位置，默认不启用（阈值为 0）；
+        # 只记录插件自身代码造成的阻塞，其他插件的阻塞只计入统计
+        self.watchdog = None
+        watchdog_threshold = config.get("watchdog_threshold", 0)
+        if watchdog_threshold > 0:
+            self.watchdog = LoopWatchdog(threshold=watchdog_threshold, on_block=self._on_loop_blocked)
+        
+        # 点歌热度榜，按群和全局统计
+        self.hot_songs = HotSongs(capacity=100, half_life=config.get("hot_half_life_days", 7) * 86400)
         
         # 初始化API
         self.init_api()
+        
+        # 预热：恢复缓存快照、预建连接、预解析热门歌曲
+        self.warm_up_songs = config.get("warm_up_songs", [])
+        self.warm_up_top = config.get("warm_up_top", 10)
+        self._warm_up_task = None
+        self._persist_task = None
+        try:
+            asyncio.get_running_loop()
+            self._start_background_tasks()
+        except RuntimeError:
+            # 没有运行中的事件循环时，推迟到第一次收到消息时预热
+            pass
 
     def init_api(self):
-        """初始化音乐API"""
-        config = self.config
-        if self.music_source == 'wy':
-            from .api.wy import NetEaseMusicAPI
-            self.api = NetEaseMusicAPI(**config)
-        elif self.music_source == 'qq':
-            from .api.qq import QQMusicAPI
-            self.api = QQMusicAPI(**config)
+        """初始化音乐API，适配器在首次使用时才导入"""
+        self.api = load_source(self.music_source, timeouts=self.timeouts, **self.config)
+
+    def _start_background_tasks(self):
+        """启动后台预热、定期持久化任务和看门狗（只启动一次）"""
+        if self.watchdog:
+            self.watchdog.start()
+        if self._warm_up_task is None:
+            self._warm_up_task = asyncio.create_task(self.warm_up())
+        if self._persist_task is None:
+            self._persist_task = asyncio.create_task(self._persist_loop())
+
+    async def _persist_loop(self, interval: float = 300):
+        """定期保存点歌热度榜"""
+        while True:
+            await asyncio.sleep(interval)
+            if self.hot_songs.dirty:
+                try:
+                    await asyncio.to_thread(self._save_hot_songs, self.hot_songs.dump())
+                except Exception as e:
+                    logger.warning(f"保存点歌热度榜失败：{e}")
+
+    @staticmethod
+    def _save_hot_songs(data: dict):
+        """将点歌热度榜写入文件"""
+        HOT_SONGS_FILE.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = HOT_SONGS_FILE.with_suffix(".tmp")
+        tmp_file.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        tmp_file.replace(HOT_SONGS_FILE)
+
+    async def warm_up(self):
+        """预热：恢复缓存快照、预建连接、预解析热门歌曲"""
+        try:
+            self._load_cache_snapshot(*await asyncio.to_thread(self._read_cache_snapshot))
+            await self.play_queue.prepare()
+            if hasattr(self.api, 'warm_up'):
+                await self.api.warm_up()
+            for song_name in self.warm_up_songs:
+                songs = await self._search(song_name, 1, priority=BULK)
+                if songs.get('data'):
+                    await self._get_media_source(songs['data'][0]['id'], priority=BULK)
+            # 预解析全局热度榜中当前音乐源的歌曲
+            hot_songs = [song for song, _ in self.hot_songs.top(n=self.warm_up_top) if song.get('source') == self.music_source]
+            if hot_songs and supports(self.api, "batch_details"):
+                await self.scheduler.run(PREFETCH, self.api.get_song_details, [song['id'] for song in hot_songs])
+            for song in hot_songs:
+                await self._get_media_source(song['id'], priority=PREFETCH)
+            logger.info("点歌插件预热完成")
+        except Exception as e:
+            logger.warning(f"点歌插件预热失败：{e}")
+
+    @staticmethod
+    def _on_loop_blocked(duration: float, stack: str):
+        """看门狗回调（在监视线程中调用）"""
+        logger.warning(f"事件循环被阻塞 {duration * 1000:.0f}ms，调用栈：\n{stack}")
+
+    @staticmethod
+    def _read_cache_snapshot() -> tuple:
+        """读取并解析缓存快照和热度榜文件（阻塞操作，在线程中执行），返回 (缓存快照, 热度榜)"""
+        snapshot, hot_songs = {}, None
+        try:
+            if CACHE_SNAPSHOT_FILE.exists():
+                snapshot = json.loads(CACHE_SNAPSHOT_FILE.read_text(encoding="utf-8"))
+        except Exception as e:
+            logger.warning(f"读取缓存快照失败：{e}")
+        if HOT_SONGS_FILE.exists():
+            try:
+                hot_songs = json.loads(HOT_SONGS_FILE.read_text(encoding="utf-8"))
+            except Exception as e:
+                logger.warning(f"读取点歌热度榜失败：{e}")
+        return snapshot, hot_songs
+
+    def _load_cache_snapshot(self, snapshot: dict, hot_songs: dict = None):
+        """在事件循环中恢复缓存，避免与正在处理的请求并发修改缓存"""
+        try:
+            self.search_cache.load(snapshot.get("search", []))
+            self.url_cache.load(snapshot.get("url", []))
+            self.extra_cache.load(snapshot.get("extra", []))
+        except Exception as e:
+            logger.warning(f"恢复缓存快照失败：{e}")
+        if hot_songs is not None:
+            try:
+                self.hot_songs.load(hot_songs)
+            except Exception as e:
+                logger.warning(f"恢复点歌热度榜失败：{e}")
+
+    def _dump_caches(self) -> dict:
+        """导出缓存快照"""
+        return {
+            "search": self.search_cache.dump(),
+            "url": self.url_cache.dump(),
+            "extra": self.extra_cache.dump(),
+        }
+
+    @staticmethod
+    def _save_cache_snapshot(snapshot: dict):
+        """将缓存快照写入文件"""
+        CACHE_SNAPSHOT_FILE.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = CACHE_SNAPSHOT_FILE.with_suffix(".tmp")
+        tmp_file.write_text(json.dumps(snapshot, ensure_ascii=False), encoding="utf-8")
+        tmp_file.replace(CACHE_SNAPSHOT_FILE)
+
+    async def _search(self, song_name: str, page: int, priority: int = SEARCH) -> dict:
+        """搜索歌曲（带缓存）"""
+        with span("search"):
+            return await self.search_cache.get_or_fetch(
+                f"{self.music_source}:{song_name}:{page}",
+                lambda ticket: self.scheduler.run(ticket, self.api.search_music, song_name, page),
+                should_cache=lambda songs: bool(songs and songs.get('data')),
+                priority=priority,
+            )
+
+    async def _get_media_source(self, song_id, priority: int = INTERACTIVE) -> dict:
+        """获取播放链接（带缓存）"""
+        async def fetch(ticket):
+            return (await self.scheduler.run(ticket, self.api.get_media_source, song_id=song_id)).get("url")
+
+        with span("media_source"):
+            url = await self.url_cache.get_or_fetch(f"{self.music_source}:{song_id}", fetch, priority=priority)
+        return {"url": url}
+
+    async def _card_metadata(self, song: dict, priority: int = INTERACTIVE) -> dict:
+        """获取音乐卡片的链接和封面（需要请求上游时带缓存）"""
+        if not supports(self.api, "card_metadata_remote"):
+            return await self.api.card_metadata(song)
+        with span("card_metadata"):
+            return await self.extra_cache.get_or_fetch(
+                f"{self.music_source}:{song['id']}",
+                lambda ticket: self.scheduler.run(ticket, self.api.card_metadata, song),
+                should_cache=lambda info: bool(info and info.get("cover")),
+                priority=priority,
+            )
+
+    async def _download_song(self, song: dict, target: Path, on_chunk=None):
+        """预下载队列中的歌曲，返回本地文件路径"""
+        url = (await self._get_media_source(song["id"], priority=PREFETCH))["url"]
+        # 只有语音模式会使用本地文件，其他模式只需提前解析播放链接
+        if not url or self.send_mode != "record":
+            return None
+        return await self.scheduler.run(PREFETCH, self._download_file, url, target, on_chunk)
+
+    async def _download_file(self, url: str, target: Path, on_chunk=None) -> Path:
+        """分块下载文件，内存占用与文件大小无关；on_chunk 在写入每块前以块大小调用，可抛出异常中止下载"""
+        path = target.with_suffix(Path(urlparse(url).path).suffix or ".mp3")
+        session = await self.api.get_session()
+        # 不限制总时长，上游连接或停止发送数据超过上游请求超时上限时放弃，避免卡住预取名额
+        timeout = aiohttp.ClientTimeout(
+            total=None, sock_connect=self.timeouts.ceiling, sock_read=self.timeouts.ceiling
+        )
+        async with session.get(url, timeout=timeout) as resp:
+            resp.raise_for_status()
+            # 打开和关闭文件可能较慢，在线程中执行；每块写入只是写入系统缓存，直接执行
+            f = await asyncio.to_thread(open, path, "wb")
+            try:
+                async for chunk in resp.content.iter_chunked(64 * 1024):
+                    if on_chunk:
+                        on_chunk(len(chunk))
+                    f.write(chunk)
+            finally:
+                await asyncio.to_thread(f.close)
+        return path
 
 
     @filter.command("music")
     async def search_music(self, event: AstrMessageEvent):
         '''搜索用户的点歌或管理音乐源''' # 这是 handler 的描述，将会被解析方便用户了解插件内容。非常建议填写。
+        self._start_background_tasks()
         message = event.message_str.replace("music", "").strip()
         args = message.split()
         logger.info(f"Received music command with args: {args}")
@@ -76,6 +356,9 @@ class MyPlugin(Star):
                 try:
                     # 重新初始化API
                     self.init_api()
+                    # 队列中的歌曲属于原音乐源，切换后清空
+                    for queue_id in list(self.play_queue.queues):
+                        self.play_queue.clear(queue_id)
                     source_name = self.SUPPORTED_SOURCES[new_source]
                     yield event.plain_result(f"音乐源已切换为：{new_source} ({source_name})")
                 except Exception as e:
@@ -87,6 +370,27 @@ class MyPlugin(Star):
                 return
         
             
+        # 处理 music queue 相关命令
+        if args and args[0] == "queue":
+            async for result in self.handle_queue(event, args[1:]):
+                yield result
+            return
+
+        # 处理 music stats 命令
+        if args == ["stats"]:
+            yield event.plain_result(self.format_stats())
+            return
+
+        # 处理 music trace 命令
+        if args == ["trace"]:
+            yield event.plain_result(self.format_traces())
+            return
+
+        # 处理 music top 命令
+        if args == ["top"]:
+            yield event.plain_result(self.format_hot_songs(event.get_group_id()))
+            return
+
         # 原有的搜索音乐逻辑
         if not args:
             yield event.plain_result("请输入要搜索的歌曲名，或使用 'music source' 查看音乐源设置，或使用 'music lyric <歌曲名>' 查看歌词。")
@@ -98,79 +402,238 @@ class MyPlugin(Star):
 
         logger.info(f"点歌请求：{song_name}，序号：{index}")
 
-        # 搜索歌曲
-        songs = await self.api.search_music(song_name, index)
-        if not songs or 'data' not in songs or not songs['data']:
-            yield event.plain_result("没能找到这首歌喵~")
-            return
+        trace = self.tracer.start("search", query=song_name, platform=event.get_platform_name())
+        trace_token = current_trace.set(trace)
+        try:
+            # 搜索歌曲
+            songs = await self._search(song_name, index)
+            if not songs or 'data' not in songs or not songs['data']:
+                yield event.plain_result("没能找到这首歌喵~")
+                return
             
-        song_list_text = "\n".join(
-            f"{i + 1}. {song['title']} - {song['artist']} ({self.format_time(song['duration'])})"
-            for i, song in enumerate(songs['data'])
-        )
+            song_list_text = self.renderer.song_list(self.music_source, songs['data'])
         
-        help_text = "\n\n请输入序号选择歌曲，或输入 '0' 重新搜索"
-        yield event.plain_result(f"找到以下歌曲喵~\n{song_list_text}{help_text}")
-        # 延迟一点点
-        await asyncio.sleep(0.2)
-
-        @session_waiter(timeout=self.timeout, record_history_chains=False)
-        async def empty_mention_waiter(controller: SessionController, event: AstrMessageEvent):
-            user_input = event.message_str.strip()
+            help_text = "\n\n请输入序号选择歌曲，或输入 '0' 重新搜索"
+            yield event.plain_result(f"找到以下歌曲喵~\n{song_list_text}{help_text}")
+            # 延迟一点点
+            await asyncio.sleep(0.2)
+            wait_start = time.perf_counter()
+
+            @session_waiter(timeout=self.timeout, record_history_chains=False)
+            async def empty_mention_waiter(controller: SessionController, event: AstrMessageEvent):
+                # 等待回调运行在另一个协程中，需要重新设置当前追踪
+                waiter_token = current_trace.set(trace)
+                try:
+                    trace.add_span("wait", wait_start, time.perf_counter())
+                    user_input = event.message_str.strip()
             
-            if user_input == '0':
-                await event.send(event.plain_result("请重新输入 music <歌曲名> 进行搜索"))
-                controller.stop()
-                return
+                    if user_input == '0':
+                        await event.send(event.plain_result("请重新输入 music <歌曲名> 进行搜索"))
+                        controller.stop()
+                        return
                 
-            if not user_input.isdigit() or int(user_input) < 1 or int(user_input) > len(songs['data']):
-                await event.send(event.plain_result("请输入正确的序号喵~ 重新来一次吧!"))
-                controller.stop()
-                return
+                    if not user_input.isdigit() or int(user_input) < 1 or int(user_input) > len(songs['data']):
+                        await event.send(event.plain_result("请输入正确的序号喵~ 重新来一次吧!"))
+                        controller.stop()
+                        return
                 
-            selected_song = songs['data'][int(user_input) - 1]
-            # 发送歌曲
-            await self._send_song(event=event, song=selected_song)
-            controller.stop()
+                    selected_song = songs['data'][int(user_input) - 1]
+                    # 发送歌曲
+                    await self._send_song(event=event, song=selected_song)
+                    controller.stop()
+                finally:
+                    current_trace.reset(waiter_token)
 
-        try:
-            await empty_mention_waiter(event)  # type: ignore
-        except TimeoutError as _:
-            yield event.plain_result("点歌超时！")
-        except Exception as e:
-            logger.error(traceback.format_exc())
-            logger.error("点歌发生错误" + str(e))
+            try:
+                await empty_mention_waiter(event)  # type: ignore
+            except TimeoutError as _:
+                trace.add_span("wait", wait_start, time.perf_counter())
+                yield event.plain_result("点歌超时！")
+            except Exception as e:
+                logger.error(traceback.format_exc())
+                logger.error("点歌发生错误" + str(e))
+        finally:
+            current_trace.reset(trace_token)
+            self._finish_trace(trace)
 
 
     async def terminate(self):
         '''可选择实现 terminate 函数，当插件被卸载/停用时会调用。'''
+        for task in (self._warm_up_task, self._persist_task):
+            if task and not task.done():
+                task.cancel()
+        # 分别保存，其中一个失败不影响另一个
+        try:
+            await asyncio.to_thread(self._save_cache_snapshot, self._dump_caches())
+        except Exception as e:
+            logger.warning(f"保存缓存快照失败：{e}")
+        try:
+            await asyncio.to_thread(self._save_hot_songs, self.hot_songs.dump())
+        except Exception as e:
+            logger.warning(f"保存点歌热度榜失败：{e}")
         if hasattr(self, 'api') and hasattr(self.api, 'close'):
             await self.api.close()
+        if self.covers:
+            await self.covers.close()
+        await self.play_queue.close()
+        if self.audio_proxy:
+            await self.audio_proxy.close()
+        if self.watchdog:
+            await self.watchdog.close()
+        for backend in {cache.backend for cache in (self.search_cache, self.url_cache, self.extra_cache)}:
+            await backend.close()
 
     @staticmethod
     def format_time(duration_ms):
         """格式化歌曲时长"""
-        duration = duration_ms // 1000
+        return format_time(duration_ms)
+        
+    async def handle_queue(self, event: AstrMessageEvent, args: list):
+        """处理点歌队列命令：add/next/list/clear"""
+        queue_id = event.unified_msg_origin
+        action = args[0] if args else "list"
 
-        hours = duration // 3600
-        minutes = (duration % 3600) // 60
-        seconds = duration % 60
+        if action == "add" and len(args) > 1:
+            index: int = int(args[-1]) if args[-1].isdigit() and len(args) > 2 else 1
+            song_name = " ".join(args[1:-1]) if args[-1].isdigit() and len(args) > 2 else " ".join(args[1:])
+            if index < 1:
+                yield event.plain_result("请输入正确的序号喵~")
+                return
+            songs = await self._search(song_name, 1)
+            if not songs or not songs.get('data'):
+                yield event.plain_result("没能找到这首歌喵~")
+                return
+            song = songs['data'][min(index, len(songs['data'])) - 1]
+            position = self.play_queue.add(queue_id, song)
+            if not position:
+                yield event.plain_result("队列已满，先听完几首再来吧~")
+                return
+            yield event.plain_result(f"已加入队列第 {position} 首：{song['title']} - {song['artist']}")
+
+        elif action == "next":
+            track = self.play_queue.next(queue_id)
+            if track is None:
+                yield event.plain_result("队列是空的喵~ 使用 'music queue add <歌曲名>' 添加歌曲")
+                return
+            trace = self.tracer.start("queue_next", local=track["path"] is not None, platform=event.get_platform_name())
+            trace_token = current_trace.set(trace)
+            try:
+                await self._send_song(event=event, song=track["song"], local_path=track["path"])
+            finally:
+                current_trace.reset(trace_token)
+                self._finish_trace(trace)
+                self.play_queue.discard(track["path"])
+
+        elif action == "list":
+            tracks = self.play_queue.tracks(queue_id)
+            if not tracks:
+                yield event.plain_result("队列是空的喵~ 使用 'music queue add <歌曲名>' 添加歌曲")
+                return
+            lines = "\n".join(
+                f"{i + 1}. {track['song']['title']} - {track['song']['artist']}{' ✅' if track['ready'] else ''}"
+                for i, track in enumerate(tracks)
+            )
+            yield event.plain_result(f"当前队列：\n{lines}\n\n使用 'music queue next' 播放下一首")
+
+        elif action == "clear":
+            self.play_queue.clear(queue_id)
+            yield event.plain_result("队列已清空")
 
-        if hours > 0:
-            return f"{hours}:{minutes:02d}:{seconds:02d}"
         else:
-            return f"{minutes:02d}:{seconds:02d}"
-        
-    async def _send_song(self, event: AstrMessageEvent, song: dict):
-        """发送歌曲"""
+            yield event.plain_result("用法：music queue add <歌曲名> [序号] | next | list | clear")
+
+    def _finish_trace(self, trace):
+        """结束请求追踪，慢请求在后台写入文件"""
+        record = self.tracer.finish(trace)
+        if record is None:
+            return
+        logger.info(f"点歌请求 {trace.trace_id} 处理耗时 {trace.active_duration:.2f}s：{trace.spans}")
+        task = asyncio.create_task(asyncio.to_thread(self.tracer.write, record))
+        self._trace_writes.add(task)
+        task.add_done_callback(self._on_trace_written)
+
+    def _on_trace_written(self, task: asyncio.Task):
+        self._trace_writes.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"写入请求追踪失败：{task.exception()}")
+
+    def format_traces(self) -> str:
+        """格式化最近最慢的点歌请求"""
+        records = self.tracer.slowest(5)
+        if not records:
+            return "最近没有点歌请求喵~"
+        lines = ["🐢 最近最慢的点歌请求"]
+        for record in records:
+            spans = "，".join(f"{name} {duration:.2f}s" for name, _, duration in record["spans"])
+            lines.append(f"{record['trace_id']} {record['command']} 处理 {record['active']:.2f}s（总 {record['duration']:.2f}s）\n  {spans}")
+        return "\n".join(lines)
+
+    def format_stats(self) -> str:
+        """格式化插件运行状态"""
+        scheduler = self.scheduler.stats()
+        if self.cache_backend == "memory":
+            cache_text = f"缓存：搜索 {len(self.search_cache)} 条，播放链接 {len(self.url_cache)} 条，歌曲信息 {len(self.extra_cache)} 条"
+        else:
+            cache_text = f"缓存：{self.cache_backend} 共享缓存"
+        lines = [
+            "📊 点歌插件状态",
+            cache_text,
+            f"调度：交互请求平均耗时 {scheduler['interactive_latency']:.2f}s，暂缓后台任务 {scheduler['deferred']} 次",
+        ]
+        for name, item in scheduler["classes"].items():
+            lines.append(f"  {name}: 运行 {item['running']}/{item['limit']}，排队 {item['waiting']}，完成 {item['completed']}")
+        timeouts = self.timeouts.stats()
+        if timeouts:
+            lines.append("超时：")
+            for name, item in timeouts.items():
+                lines.append(
+                    f"  {name}: {item['timeout']:.2f}s（耗时 {item['mean']:.2f}±{item['deviation']:.2f}s，"
+                    f"样本 {item['samples']}，超时 {item['timeouts']} 次）"
+                )
+        if self.watchdog:
+            watchdog = self.watchdog.stats(top=3)
+            lines.append(
+                f"事件循环：延迟 平均 {watchdog['lag_mean'] * 1000:.1f}ms，p99 {watchdog['lag_p99'] * 1000:.1f}ms，"
+                f"最大 {watchdog['lag_max'] * 1000:.1f}ms；阻塞 {watchdog['blocks']} 次，共 {watchdog['blocked_time']:.2f}s"
+            )
+            for item in watchdog["locations"]:
+                lines.append(f"  {item['location']}：采样 {item['samples']}，阻塞 {item['blocks']} 次，最长 {item['max'] * 1000:.0f}ms")
+        return "\n".join(lines)
+
+    def format_hot_songs(self, group_id: str = None) -> str:
+        """格式化群和全局的点歌热度榜"""
+        sections = []
+        boards = [("本群热歌", group_id)] if group_id else []
+        boards.append(("全站热歌", None))
+        for title, group in boards:
+            top = self.hot_songs.top(group, n=10)
+            if not top:
+                continue
+            lines = "\n".join(
+                f"{i + 1}. {song['title']} - {song['artist']} ({count:.0f}次)"
+                for i, (song, count) in enumerate(top)
+            )
+            sections.append(f"🔥 {title}\n{lines}")
+        return "\n\n".join(sections) if sections else "还没有人点过歌喵~"
+
+    async def _send_song(self, event: AstrMessageEvent, song: dict, local_path: Path = None):
+        """发送歌曲，local_path 为预下载的本地文件，语音模式下优先使用"""
+        self.hot_songs.record(
+            f"{self.music_source}:{song['id']}",
+            {"source": self.music_source, "id": song["id"], "title": song.get("title"), "artist": song.get("artist")},
+            group=event.get_group_id(),
+        )
         try:
             platform_name = event.get_platform_name()
             send_mode = self.send_mode
 
             # 发卡片
             if platform_name == "aiocqhttp" and send_mode == "card":
-                audio_url = (await self.api.get_media_source(song_id=song["id"]))["url"]
-                info = await self.api.fetch_extra(str(song["id"]))
+                media_result, info = await asyncio.gather(
+                    self._get_media_source(song["id"]),
+                    self._card_metadata(song),
+                )
+                audio_url = media_result["url"]
                 
                 # 如果获取不到音频链接，使用文本模式
                 if not audio_url:
@@ -179,31 +642,49 @@ class MyPlugin(Star):
                     
                 client = event.bot
                 is_private = event.is_private_chat()
+                image = info['cover']
                 
-                if isinstance(event, AiocqhttpMessageEvent):
+                if is_platform_event(event, "aiocqhttp"):
+                    # 使用本地缓存的小尺寸封面
+                    if self.covers:
+                        with span("cover"):
+                            cover_path = await self.covers.get_cover(image, self.cover_size)
+                        if cover_path:
+                            # 协议端需要可下载的链接，经本地 HTTP 服务提供缩放后的封面，失败时使用原图链接
+                            try:
+                                image = await self.audio_proxy.static_url("cover", cover_path, self.cover_base_url)
+                            except Exception as e:
+                                logger.warning(f"提供本地封面失败: {e}")
+
                     payloads: dict = {
                         "message": [
                             {
                                 "type": "music",
                                 "data": {
-                                    "type": "163" if self.music_source == "wy" else "qq",
-                                    "url": info['link'] if self.music_source == "wy" else f'https://y.qq.com/n/ryqq/songDetail/{song["id"]}',
+                                    "type": self.api.CARD_TYPE,
+                                    "url": info['link'],
                                     'audio': audio_url,
                                     "title": song.get("title"),
-                                    "image": info['cover'] if self.music_source == "wy" else song['artwork'],
+                                    "image": image,
                                 },
                             }
                         ],
                     }
-                    if is_private:
-                        payloads["user_id"] = event.get_sender_id()
-                        await client.api.call_action("send_private_msg", **payloads)
-                    else:
-                        payloads["group_id"] = event.get_group_id()
-                        await client.api.call_action("send_group_msg", **payloads)
-                elif isinstance(event, WeChatPadProMessageEvent):
+                    with span("call_action"):
+                        if is_private:
+                            payloads["user_id"] = event.get_sender_id()
+                            await client.api.call_action("send_private_msg", **payloads)
+                        else:
+                            payloads["group_id"] = event.get_group_id()
+                            await client.api.call_action("send_group_msg", **payloads)
+                elif is_platform_event(event, "wechatpadpro"):
                     # 构造微信音乐卡片XML
-                    contentXML = f"""<msg><appmsg appid="" sdkver="0x70900000"><title>{song.get("title")}</title><des>{song.get("artist")}</des><action>view</action><type>3</type><showtype>0</showtype><soundtype>1</soundtype><mediatagname></mediatagname><messageext></messageext><messageaction></messageaction><content></content><contentattr>0</contentattr><url>{info['link'] if self.music_source == "wy" else f'https://y.qq.com/n/ryqq/songDetail/{song["id"]}'}</url><lowurl></lowurl><dataurl>{audio_url}</dataurl><lowdataurl></lowdataurl><songalbumurl></songalbumurl><songlyric></songlyric><mediadataurl></mediadataurl><weburl></weburl><autostart>false</autostart><headerstyle>0</headerstyle></appmsg></msg>"""
+                    contentXML = self.renderer.wechat_music_xml(
+                        self.music_source,
+                        song,
+                        info['link'],
+                        audio_url,
+                    )
                     payloads: dict = {
                         "AppList": [
                             {
@@ -213,19 +694,36 @@ class MyPlugin(Star):
                             }
                         ],
                     }
-                    await client.api.call_action("send_app_msg", **payloads)
+                    with span("call_action"):
+                        await client.api.call_action("send_app_msg", **payloads)
                     
             # 发语音
             elif platform_name in ["telegram", "lark", "aiocqhttp"] and send_mode == "record":
-                media_result = await self.api.get_media_source(song_id=song["id"])
+                if local_path and local_path.exists():
+                    with span("send"):
+                        await event.send(event.chain_result([Record.fromFileSystem(str(local_path.resolve()))]))
+                    return
+
+                media_result = await self._get_media_source(song["id"])
                 audio_url = media_result["url"]
                 
                 # 如果获取不到音频链接，使用文本模式
                 if not audio_url:
                     await self._send_song_as_text(event, song)
                     return
+
+                record = Record.fromURL(audio_url)
+                if self.relay_audio:
+                    # 已缓存的直接发送本地文件，否则经本地中转边下载边缓存
+                    name = f"{self.music_source}:{song['id']}"
+                    cached_file = self.audio_proxy.cached_file(name)
+                    if cached_file:
+                        record = Record.fromFileSystem(str(cached_file.resolve()))
+                    else:
+                        record = Record.fromURL(await self.audio_proxy.register(name, audio_url))
                     
-                await event.send(event.chain_result([Record.fromURL(audio_url)]))
+                with span("send"):
+                    await event.send(event.chain_result([record]))
 
             # 发文字
             else:
@@ -239,24 +737,15 @@ class MyPlugin(Star):
     async def _send_song_as_text(self, event: AstrMessageEvent, song: dict):
         """以文本形式发送歌曲信息"""
         try:
-            media_result = await self.api.get_media_source(song_id=song["id"])
+            media_result = await self._get_media_source(song["id"])
             audio_url = media_result.get("url", "")
             
-            song_info_str = (
-                f"🎶 {song.get('title', '未知歌曲')} - {song.get('artist', '未知歌手')}\n"
-                f"⏰ 时长: {self.format_time(song.get('duration', 0))}\n"
-            )
-            
-            if audio_url:
-                song_info_str += f"🔗 播放链接：{audio_url}\n"
-            else:
-                song_info_str += "❌ 未能获取播放链接\n"
-                
             # 添加音乐源信息
             source_name = self.SUPPORTED_SOURCES.get(self.music_source, "未知")
-            song_info_str += f"📻 来源: {source_name}"
+            song_info_str = self.renderer.song_text(self.music_source, source_name, song, audio_url)
             
-            await event.send(event.plain_result(song_info_str))
+            with span("send"):
+                await event.send(event.plain_result(song_info_str))
         except Exception as e:
             logger.error(f"以文本形式发送歌曲信息时出错: {e}")
             await event.send(event.plain_result("发送歌曲信息时出现错误"))
\ No newline at end of file
@@ -0,0 +1,312 @@
+import aiohttp
+import asyncio
+import hashlib
+import os
+import re
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+from aiohttp import web
+
+CHUNK_SIZE = 64 * 1024
+RANGE_PATTERN = re.compile(r"bytes=(\d*)-(\d*)")
+KEY_PATTERN = re.compile(r"[0-9a-f]{20}")
+
+
+class _Stream:
+    """一次上游下载，数据写入临时文件，多个听众从文件中读取已下载的部分"""
+
+    def __init__(self, part_path: Path, final_path: Path):
+        self.part_path = part_path
+        self.final_path = final_path
+        self.written = 0
+        self.total: Optional[int] = None
+        self.content_type = "application/octet-stream"
+        self.done = False
+        self.error: Optional[Exception] = None
+        self.ready = asyncio.Event()
+        self.progress = asyncio.Condition()
+
+    async def notify(self):
+        async with self.progress:
+            self.progress.notify_all()
+
+
+class AudioProxy:
+    """
+    本地音频中转
+    平台适配器从本地地址拉取音频，中转服务分块读取上游数据，同时写入磁盘缓存并转发给所有听众；
+    内存占用与文件大小无关，支持 Range 请求，同一首歌的并发听众共用一个上游连接。
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        max_bytes: int = 1024 * 1024 * 1024,
+        public_host: str = "",
+        static_dirs: Optional[Dict[str, Path]] = None,
+        max_urls: int = 1024,
+        read_timeout: float = 30,
+    ):
+        """
+        :param host: 监听地址
+        :param public_host: 生成链接使用的地址，平台适配器与插件不在同一主机时填写，留空使用监听地址
+        :param static_dirs: 额外提供下载的本地目录，路径前缀 -> 目录，如 {"cover": 封面缓存目录}
+        :param max_urls: 登记的上游地址最多保留的条数，超出时丢弃最早登记的
+        :param read_timeout: 上游连接和两次读取之间的超时（秒），超时后下载失败
+        """
+        self.cache_dir = Path(cache_dir)
+        self.host = host
+        self.port = port
+        self.max_bytes = max_bytes
+        self.public_host = public_host or host
+        self.static_dirs = {prefix: Path(directory) for prefix, directory in (static_dirs or {}).items()}
+        self.max_urls = max_urls
+        self.read_timeout = read_timeout
+        self.session = None
+        self._runner: Optional[web.AppRunner] = None
+        self._start_lock = asyncio.Lock()
+        # 键 -> 上游地址，只保留尚未缓存完成的，按登记顺序淘汰
+        self._urls: "OrderedDict[str, str]" = OrderedDict()
+        # 键 -> 进行中的上游下载
+        self._streams: Dict[str, _Stream] = {}
+        # 进行中的下载任务，保留引用避免任务被回收，关闭时取消
+        self._fetch_tasks = set()
+
+    async def get_session(self):
+        """获取或创建 aiohttp session"""
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession()
+        return self.session
+
+    async def start(self):
+        """启动中转服务（只启动一次）"""
+        async with self._start_lock:
+            if self._runner is not None:
+                return
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            app = web.Application()
+            app.router.add_get("/audio/{key}", self._handle)
+            for prefix, directory in self.static_dirs.items():
+                directory.mkdir(parents=True, exist_ok=True)
+                app.router.add_static(f"/{prefix}", directory)
+            runner = web.AppRunner(app, access_log=None)
+            await runner.setup()
+            site = web.TCPSite(runner, self.host, self.port)
+            await site.start()
+            # 端口为 0 时使用系统分配的端口
+            self.port = runner.addresses[0][1]
+            self._runner = runner
+
+    async def close(self):
+        # 先取消进行中的下载（删除临时文件），再关闭服务和 session
+        tasks = list(self._fetch_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        if self.session and not self.session.closed:
+            await self.session.close()
+
+    @staticmethod
+    def make_key(name: str) -> str:
+        return hashlib.sha1(name.encode("utf-8")).hexdigest()[:20]
+
+    def _final_path(self, key: str, url: str) -> Path:
+        suffix = Path(urlparse(url).path).suffix or ".mp3"
+        return self.cache_dir / f"{key}{suffix}"
+
+    def cached_file(self, name: str) -> Optional[Path]:
+        """已完整缓存的本地文件，没有则返回 None"""
+        return self._cached_path(self.make_key(name))
+
+    def _cached_path(self, key: str) -> Optional[Path]:
+        if key in self._streams:
+            return None
+        for path in self.cache_dir.glob(f"{key}.*"):
+            if path.suffix != ".part":
+                return path
+        return None
+
+    async def register(self, name: str, url: str) -> str:
+        """
+        登记上游地址，返回本地中转地址
+        :param name: 歌曲的唯一名称，如 "wy:123"
+        :param url: 上游音频地址
+        """
+        await self.start()
+        key = self.make_key(name)
+        self._urls[key] = url
+        self._urls.move_to_end(key)
+        while len(self._urls) > self.max_urls:
+            self._urls.popitem(last=False)
+        return f"{self.base_url}/audio/{key}"
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.public_host}:{self.port}"
+
+    async def static_url(self, prefix: str, path: Path, base_url: str = "") -> str:
+        """
+        返回 static_dirs 中本地文件的下载地址
+        :param prefix: static_dirs 中的路径前缀
+        :param path: 该目录下的文件
+        :param base_url: 对外的地址（如反向代理到本服务的公网地址），留空使用本服务的地址
+        """
+        await self.start()
+        relative = Path(path).resolve().relative_to(self.static_dirs[prefix].resolve())
+        return f"{base_url.rstrip('/') or self.base_url}/{prefix}/{relative.as_posix()}"
+
+    def _open_stream(self, key: str, url: str) -> _Stream:
+        stream = self._streams.get(key)
+        if stream is None:
+            final_path = self._final_path(key, url)
+            stream = _Stream(final_path.with_suffix(final_path.suffix + ".part"), final_path)
+            self._streams[key] = stream
+            task = asyncio.create_task(self._fetch(key, url, stream))
+            self._fetch_tasks.add(task)
+            task.add_done_callback(self._fetch_tasks.discard)
+        return stream
+
+    async def _fetch(self, key: str, url: str, stream: _Stream):
+        """从上游分块下载到临时文件，完成后改名为缓存文件"""
+        try:
+            session = await self.get_session()
+            # 不限制总时长（大文件下载较慢），上游停止发送数据时下载失败，听众随之结束
+            timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.read_timeout, sock_read=self.read_timeout)
+            async with session.get(url, timeout=timeout) as resp:
+                resp.raise_for_status()
+                stream.total = resp.content_length
+                stream.content_type = resp.content_type or stream.content_type
+                with open(stream.part_path, "wb") as f:
+                    stream.ready.set()
+                    async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                        f.write(chunk)
+                        f.flush()
+                        stream.written += len(chunk)
+                        await stream.notify()
+            os.replace(stream.part_path, stream.final_path)
+            stream.done = True
+            # 已缓存的文件按键直接提供，不再需要上游地址
+            self._urls.pop(key, None)
+            await asyncio.to_thread(self._evict)
+        except asyncio.CancelledError:
+            stream.error = ConnectionAbortedError("中转服务已关闭")
+            stream.part_path.unlink(missing_ok=True)
+            raise
+        except Exception as e:
+            print(f"中转音频下载失败: {url}, 错误: {e!r}")
+            stream.error = e
+            stream.part_path.unlink(missing_ok=True)
+        finally:
+            stream.ready.set()
+            await stream.notify()
+            self._streams.pop(key, None)
+
+    def _evict(self):
+        """缓存超出容量时按访问时间删除最旧的文件（阻塞操作，在线程中执行）"""
+        files = []
+        total = 0
+        for path in self.cache_dir.iterdir():
+            if path.suffix == ".part" or not path.is_file():
+                continue
+            stat = path.stat()
+            files.append((stat.st_atime, stat.st_size, path))
+            total += stat.st_size
+        files.sort()
+        for _, size, path in files:
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    @staticmethod
+    def _parse_range(header: Optional[str], total: Optional[int]) -> Optional[Tuple[int, int]]:
+        """解析 Range 请求头，返回 [start, end] 闭区间，不支持或无效时返回 None"""
+        if not header or total is None:
+            return None
+        match = RANGE_PATTERN.fullmatch(header.strip())
+        if not match or match.group(1) == match.group(2) == "":
+            return None
+        if match.group(1) == "":
+            # bytes=-N 表示最后 N 个字节
+            start, end = max(total - int(match.group(2)), 0), total - 1
+        else:
+            start = int(match.group(1))
+            end = min(int(match.group(2)), total - 1) if match.group(2) else total - 1
+        if start > end:
+            return None
+        return start, end
+
+    async def _handle(self, request: web.Request) -> web.StreamResponse:
+        key = request.match_info["key"]
+        if not KEY_PATTERN.fullmatch(key):
+            raise web.HTTPNotFound()
+        cached_path = self._cached_path(key)
+        if cached_path is not None:
+            # 已完整缓存，FileResponse 自带 Range 支持
+            return web.FileResponse(cached_path)
+        url = self._urls.get(key)
+        if url is None:
+            raise web.HTTPNotFound()
+
+        stream = self._open_stream(key, url)
+        await stream.ready.wait()
+        if stream.error is not None and stream.written == 0:
+            raise web.HTTPBadGateway()
+
+        byte_range = self._parse_range(request.headers.get("Range"), stream.total)
+        headers = {"Content-Type": stream.content_type, "Accept-Ranges": "bytes"}
+        if byte_range is not None:
+            start, end = byte_range
+            response = web.StreamResponse(status=206, headers=headers)
+            response.headers["Content-Range"] = f"bytes {start}-{end}/{stream.total}"
+            response.content_length = end - start + 1
+        else:
+            start, end = 0, None
+            response = web.StreamResponse(status=200, headers=headers)
+            if stream.total is not None:
+                response.content_length = stream.total
+        await response.prepare(request)
+        await self._relay(stream, response, start, end)
+        if stream.error is not None:
+            # 上游下载中途失败，断开连接，让听众知道数据不完整而不是一直等待剩余部分
+            if request.transport is not None:
+                request.transport.close()
+            return response
+        await response.write_eof()
+        return response
+
+    async def _relay(self, stream: _Stream, response: web.StreamResponse, start: int, end: Optional[int]):
+        """从临时文件读取已下载的数据转发给听众，response.write 会等待听众接收，形成背压"""
+        try:
+            f = open(stream.part_path, "rb")
+        except FileNotFoundError:
+            # 下载已完成并改名
+            f = open(stream.final_path, "rb")
+        with f:
+            position = start
+            limit = end + 1 if end is not None else None
+            while limit is None or position < limit:
+                available = stream.written - position
+                if available > 0:
+                    size = min(CHUNK_SIZE, available, limit - position if limit is not None else CHUNK_SIZE)
+                    f.seek(position)
+                    data = f.read(size)
+                    if not data:
+                        break
+                    await response.write(data)
+                    position += len(data)
+                elif stream.done or stream.error is not None:
+                    break
+                else:
+                    async with stream.progress:
+                        await stream.progress.wait_for(
+                            lambda: stream.written > position or stream.done or stream.error is not None
+                        )
@@ -0,0 +1,554 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from urllib.parse import unquote, urlparse
+
+from .cache import TTLCache
+from .scheduler import Ticket
+
+
+class CacheBackend:
+    """
+    缓存后端接口
+    值需可 JSON 序列化；锁用于多实例部署时保证同一个键只有一个实例向上游请求
+    """
+
+    name = "base"
+
+    async def get(self, key: str) -> Any:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    async def acquire_lock(self, key: str, ttl: float) -> Optional[str]:
+        """尝试获取短期锁，成功返回锁令牌，锁已被占用返回 None"""
+        raise NotImplementedError
+
+    async def release_lock(self, key: str, token: str):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+    def __len__(self):
+        return 0
+
+
+class MemoryBackend(CacheBackend):
+    """进程内缓存，锁始终获取成功（进程内的并发已由 Cache 合并）"""
+
+    name = "memory"
+
+    def __init__(self, maxsize: int = 1024):
+        self.cache = TTLCache(maxsize=maxsize)
+
+    def __len__(self):
+        return len(self.cache)
+
+    async def get(self, key: str) -> Any:
+        return self.cache.get(key)
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self.cache.set(key, value, ttl)
+
+    async def acquire_lock(self, key: str, ttl: float) -> Optional[str]:
+        return "local"
+
+    async def release_lock(self, key: str, token: str):
+        pass
+
+    def dump(self) -> List[list]:
+        return self.cache.dump()
+
+    def load(self, items: List[list]):
+        self.cache.load(items)
+
+
+class SQLiteBackend(CacheBackend):
+    """
+    本地 SQLite 文件缓存，同一台机器上的多个实例可共享
+    数据库操作在线程中执行，不阻塞事件循环
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS locks (key TEXT PRIMARY KEY, token TEXT, expires_at REAL)")
+        return self._conn
+
+    def _execute(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            cursor = self._connect().execute(sql, params)
+            return cursor.fetchall()
+
+    async def _run(self, sql: str, params: tuple = ()) -> list:
+        return await asyncio.to_thread(self._execute, sql, params)
+
+    async def get(self, key: str) -> Any:
+        rows = await self._run(
+            "SELECT value FROM cache WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time()),
+        )
+        return json.loads(rows[0][0]) if rows else None
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        expires_at = time.time() + ttl if ttl else None
+        await self._run(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value, ensure_ascii=False), expires_at),
+        )
+
+    async def acquire_lock(self, key: str, ttl: float) -> Optional[str]:
+        token = uuid.uuid4().hex
+        now = time.time()
+        await self._run("DELETE FROM locks WHERE key = ? AND expires_at <= ?", (key, now))
+        await self._run("INSERT OR IGNORE INTO locks (key, token, expires_at) VALUES (?, ?, ?)", (key, token, now + ttl))
+        rows = await self._run("SELECT token FROM locks WHERE key = ?", (key,))
+        return token if rows and rows[0][0] == token else None
+
+    async def release_lock(self, key: str, token: str):
+        await self._run("DELETE FROM locks WHERE key = ? AND token = ?", (key, token))
+
+    async def close(self):
+        if self._conn is not None:
+            await asyncio.to_thread(self._conn.close)
+            self._conn = None
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisBackend(CacheBackend):
+    """
+    Redis 协议（RESP）缓存后端，多台机器上的实例可共享
+    使用 GET/SET 命令，释放锁使用 EVAL 原子地比较并删除；
+    不支持 EVAL 的替代服务退回 GET + DEL，此时释放锁只是尽力而为（锁过期后可能误删其他实例的锁）
+    """
+
+    name = "redis"
+    # 只有锁仍属于自己时才删除
+    UNLOCK_SCRIPT = 'if redis.call("GET", KEYS[1]) == ARGV[1] then return redis.call("DEL", KEYS[1]) else return 0 end'
+
+    def __init__(self, url: str = "redis://127.0.0.1:6379/0", prefix: str = "ikun_music:", timeout: float = 2.0, timeouts=None):
+        """
+        :param timeout: 单次命令往返的超时上限（秒）
+        :param timeouts: 自适应超时（utils.timeouts.AdaptiveTimeouts），按 Redis 的响应耗时收紧超时
+        """
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.prefix = prefix
+        self.timeout = timeout
+        self.timeouts = timeouts
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock = asyncio.Lock()
+        self._eval_supported = True
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            await self._send("AUTH", self.password)
+        if self.db:
+            await self._send("SELECT", self.db)
+
+    def _drop(self):
+        """断开连接，下一条命令重新连接（连接上可能残留未读取的响应）"""
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def _send(self, *args) -> Any:
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+        self._writer.write(b"".join(parts))
+        await self._writer.drain()
+        return await self._read_reply()
+
+    async def _read_reply(self) -> Any:
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("Redis 连接已断开")
+        prefix, body = line[:1], line[1:-2]
+        if prefix == b"+":
+            return body.decode()
+        if prefix == b"-":
+            raise RedisError(body.decode())
+        if prefix == b":":
+            return int(body)
+        if prefix == b"$":
+            length = int(body)
+            if length < 0:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2]
+        if prefix == b"*":
+            count = int(body)
+            if count < 0:
+                return None
+            return [await self._read_reply() for _ in range(count)]
+        raise RedisError(f"无法解析的响应: {line!r}")
+
+    async def _round_trip(self, *args) -> Any:
+        """发送一条命令并读取响应，需要时先建立连接"""
+        if self._writer is None or self._writer.is_closing():
+            await self._connect()
+        return await self._send(*args)
+
+    async def _command(self, *args) -> Any:
+        async with self._lock:
+            timeout_context = self.timeouts.measure("cache:redis") if self.timeouts else nullcontext(self.timeout)
+            try:
+                with timeout_context as timeout:
+                    try:
+                        return await asyncio.wait_for(self._round_trip(*args), min(timeout, self.timeout))
+                    except (ConnectionError, asyncio.IncompleteReadError):
+                        # 复用的连接已被服务端关闭时重连一次
+                        self._drop()
+                        return await asyncio.wait_for(self._round_trip(*args), min(timeout, self.timeout))
+            except BaseException:
+                # 超时、取消或读到一半出错时，连接上可能残留上一条命令的响应，不能再复用
+                self._drop()
+                raise
+
+    async def get(self, key: str) -> Any:
+        data = await self._command("GET", self.prefix + key)
+        return json.loads(data) if data is not None else None
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        args = ["SET", self.prefix + key, json.dumps(value, ensure_ascii=False)]
+        if ttl:
+            args += ["PX", int(ttl * 1000)]
+        await self._command(*args)
+
+    async def acquire_lock(self, key: str, ttl: float) -> Optional[str]:
+        token = uuid.uuid4().hex
+        result = await self._command("SET", f"{self.prefix}lock:{key}", token, "NX", "PX", int(ttl * 1000))
+        return token if result == "OK" else None
+
+    async def release_lock(self, key: str, token: str):
+        lock_key = f"{self.prefix}lock:{key}"
+        if self._eval_supported:
+            try:
+                await self._command("EVAL", self.UNLOCK_SCRIPT, 1, lock_key, token)
+                return
+            except RedisError:
+                self._eval_supported = False
+        current = await self._command("GET", lock_key)
+        if current is not None and current.decode() == token:
+            await self._command("DEL", lock_key)
+
+    async def close(self):
+        self._drop()
+
+
+class _Inflight:
+    """进行中的上游请求，由独立任务执行，调用方共享结果"""
+
+    def __init__(self, task: asyncio.Task, ticket: Optional[Ticket]):
+        self.task = task
+        self.ticket = ticket
+        self.waiters = 0
+
+
+class Cache:
+    """
+    带命名空间的缓存
+    同一进程内对同一个键的并发请求合并为一次，多实例部署时通过后端的短期锁保证只有一个实例请求上游；
+    后端出错时跳过缓存直接请求上游，一段时间后再重试后端。
+    """
+
+    def __init__(
+        self,
+        backend: CacheBackend,
+        namespace: str,
+        ttl: Optional[float] = None,
+        lock_ttl: float = 10,
+        poll_interval: float = 0.1,
+        retry_after: float = 10,
+        logger: logging.Logger = None,
+    ):
+        self.backend = backend
+        self.namespace = namespace
+        self.ttl = ttl
+        self.lock_ttl = lock_ttl
+        self.poll_interval = poll_interval
+        self.retry_after = retry_after
+        self.logger = logger or logging.getLogger(__name__)
+        self.errors = 0
+        self._down_until = 0.0
+        self._inflight: Dict[str, _Inflight] = {}
+
+    def __len__(self):
+        return len(self.backend)
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    async def _call(self, method: str, *args, default=None) -> Any:
+        """调用后端，出错时记录并返回 default，retry_after 秒内不再访问后端"""
+        if time.monotonic() < self._down_until:
+            return default
+        try:
+            return await getattr(self.backend, method)(*args)
+        except Exception as e:
+            self.errors += 1
+            self._down_until = time.monotonic() + self.retry_after
+            self.logger.warning(f"缓存后端 {self.backend.name} 出错，{self.retry_after:.0f} 秒内跳过缓存: {type(e).__name__} {e}")
+            return default
+
+    async def get(self, key: str) -> Any:
+        return await self._call("get", self._key(key))
+
+    async def set(self, key: str, value: Any):
+        await self._call("set", self._key(key), value, self.ttl)
+
+    async def get_or_fetch(
+        self,
+        key: str,
+        fetch: Callable[..., Awaitable[Any]],
+        should_cache: Callable[[Any], bool] = bool,
+        priority: Optional[int] = None,
+    ) -> Any:
+        """
+        读取缓存，未命中时调用 fetch 获取并写入缓存
+        :param fetch: 获取数据的协程函数；指定 priority 时以调度凭据 Ticket 为参数调用
+        :param should_cache: 判断结果是否应写入缓存
+        :param priority: 调用方的优先级，共享同一个请求的调用方中最高的优先级生效
+        """
+        value = await self.get(key)
+        if value is not None:
+            return value
+
+        entry = self._inflight.get(key)
+        if entry is None:
+            ticket = Ticket(priority) if priority is not None else None
+            task = asyncio.create_task(self._fetch_locked(key, (lambda: fetch(ticket)) if ticket else fetch, should_cache))
+            entry = self._inflight[key] = _Inflight(task, ticket)
+            task.add_done_callback(lambda _: self._inflight.pop(key, None) if self._inflight.get(key) is entry else None)
+        elif priority is not None and entry.ticket is not None:
+            entry.ticket.escalate(priority)
+
+        # 请求在独立任务中执行，某个调用方被取消不影响其他调用方；所有调用方都取消后才取消请求
+        entry.waiters += 1
+        try:
+            return await asyncio.shield(entry.task)
+        finally:
+            entry.waiters -= 1
+            if entry.waiters == 0 and not entry.task.done():
+                entry.task.cancel()
+                if self._inflight.get(key) is entry:
+                    del self._inflight[key]
+
+    async def _fetch_locked(self, key: str, fetch, should_cache) -> Any:
+        full_key = self._key(key)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.lock_ttl
+        # 后端出错时视为已获得锁，直接请求上游
+        token = await self._call("acquire_lock", full_key, self.lock_ttl, default="")
+        # 其他实例正在请求时等待其写入缓存，超时后自行请求
+        while token is None and loop.time() < deadline:
+            await asyncio.sleep(self.poll_interval)
+            value = await self.get(key)
+            if value is not None:
+                return value
+            token = await self._call("acquire_lock", full_key, self.lock_ttl, default="")
+
+        try:
+            value = await fetch()
+            if should_cache(value):
+                await self.set(key, value)
+            return value
+        finally:
+            if token:
+                await self._call("release_lock", full_key, token)
+
+    def dump(self) -> List[list]:
+        """导出缓存快照，只有进程内缓存需要快照"""
+        return self.backend.dump() if isinstance(self.backend, MemoryBackend) else []
+
+    def load(self, items: List[list]):
+        if isinstance(self.backend, MemoryBackend):
+            self.backend.load(items)
+
+
+def create_backend(
+    name: str,
+    maxsize: int = 1024,
+    sqlite_path: Path = None,
+    redis_url: str = None,
+    timeouts=None,
+) -> CacheBackend:
+    """根据配置创建缓存后端"""
+    if name == "sqlite":
+        return SQLiteBackend(sqlite_path)
+    if name == "redis":
+        return RedisBackend(redis_url or "redis://127.0.0.1:6379/0", timeouts=timeouts)
+    return MemoryBackend(maxsize)
+
+
+class LocalRedis:
+    """
+    本地 RESP 替身，在没有 Redis 的环境中测试 RedisBackend
+    只实现 PING/AUTH/SELECT/GET/SET(NX/PX)/DEL，以及 EVAL 中的释放锁脚本
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, delay: float = 0.0):
+        """
+        :param port: 监听端口，0 表示自动分配
+        :param delay: 每条命令的响应延迟（秒），模拟缓慢或卡住的服务
+        """
+        self.host = host
+        self.port = port
+        self.delay = delay
+        self.commands = 0
+        # 键 -> (值, 过期时间)
+        self.data: Dict[bytes, tuple] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._writers = set()
+
+    @property
+    def url(self) -> str:
+        return f"redis://{self.host}:{self.port}/0"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        """停止服务并断开所有连接，模拟服务宕机"""
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._writers):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._writers.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                args = []
+                for _ in range(int(line[1:-2])):
+                    length = int((await reader.readline())[1:-2])
+                    args.append((await reader.readexactly(length + 2))[:-2])
+                self.commands += 1
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+                writer.write(self._execute(args))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    def _get(self, key: bytes) -> Optional[bytes]:
+        item = self.data.get(key)
+        if item is None:
+            return None
+        if item[1] is not None and item[1] <= time.monotonic():
+            del self.data[key]
+            return None
+        return item[0]
+
+    def _execute(self, args: List[bytes]) -> bytes:
+        command = args[0].upper()
+        if command == b"PING":
+            return b"+PONG\r\n"
+        if command in (b"AUTH", b"SELECT"):
+            return b"+OK\r\n"
+        if command == b"GET":
+            value = self._get(args[1])
+            return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+        if command == b"SET":
+            options = [arg.upper() for arg in args[3:]]
+            if b"NX" in options and self._get(args[1]) is not None:
+                return b"$-1\r\n"
+            expires_at = None
+            if b"PX" in options:
+                expires_at = time.monotonic() + int(options[options.index(b"PX") + 1]) / 1000
+            self.data[args[1]] = (args[2], expires_at)
+            return b"+OK\r\n"
+        if command == b"DEL":
+            return b":%d\r\n" % sum(self.data.pop(key, None) is not None for key in args[1:])
+        if command == b"EVAL" and args[1].decode() == RedisBackend.UNLOCK_SCRIPT:
+            if self._get(args[3]) == args[4]:
+                del self.data[args[3]]
+                return b":1\r\n"
+            return b":0\r\n"
+        return b"-ERR unknown command '%s'\r\n" % command
+
+
+# 示例测试方法：用本地 RESP 替身模拟两个实例共享 Redis 缓存
+async def main():
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    server = LocalRedis()
+    await server.start()
+    backends = [RedisBackend(server.url, timeout=0.5) for _ in range(2)]
+    caches = [Cache(backend, "search", ttl=60, retry_after=1) for backend in backends]
+    fetches = 0
+
+    async def fetch():
+        nonlocal fetches
+        fetches += 1
+        await asyncio.sleep(0.3)
+        return {"data": ["晴天"]}
+
+    try:
+        # 两个实例同时请求同一个键，只有一个实例请求上游
+        results = await asyncio.gather(*[cache.get_or_fetch("晴天", fetch) for cache in caches for _ in range(3)])
+        print(f"6 个并发请求，上游请求 {fetches} 次，结果一致：{all(result == results[0] for result in results)}")
+
+        # 锁过期后被其他实例获取，原持有者释放锁时不会删除其他实例的锁
+        stale = await backends[0].acquire_lock("晴天", ttl=0.1)
+        await asyncio.sleep(0.2)
+        current = await backends[1].acquire_lock("晴天", ttl=10)
+        await backends[0].release_lock("晴天", stale)
+        print(f"过期锁释放后，其他实例的锁仍然有效：{await backends[1].acquire_lock('晴天', ttl=10) is None}")
+        await backends[1].release_lock("晴天", current)
+
+        # 服务变慢时命令超时，跳过缓存直接请求上游
+        server.delay = 1.0
+        fetches = 0
+        print(f"服务变慢：{await caches[0].get_or_fetch('稻香', fetch)}，上游请求 {fetches} 次")
+        server.delay = 0
+
+        # 服务宕机时跳过缓存直接请求上游
+        await server.close()
+        await asyncio.sleep(1)
+        print(f"服务宕机：{await caches[1].get_or_fetch('七里香', fetch)}，后端出错 {caches[1].errors} 次")
+    finally:
+        for backend in backends:
+            await backend.close()
+        await server.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
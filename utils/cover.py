@@ -0,0 +1,204 @@
+import aiohttp
+import asyncio
+import hashlib
+import io
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow 为可选依赖，缺失时直接缓存原图
+    Image = None
+
+
+class CoverCache:
+    """
+    封面图片缓存
+    下载一次封面，在线程池中缩放为卡片所需尺寸，按内容哈希存放在磁盘上，超出容量时按最近访问时间淘汰
+    """
+
+    INDEX_FILE = "index.json"
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        sizes: Iterable[int] = (300,),
+        max_bytes: int = 64 * 1024 * 1024,
+        max_workers: int = 2,
+        timeout: float = 3.0,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.timeout = timeout
+        self.sizes = tuple(sorted({int(size) for size in sizes if int(size) > 0}))
+        self.max_bytes = max_bytes
+        self.session = None
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ikun_cover")
+        # 封面URL -> 内容哈希
+        self._index: Dict[str, str] = {}
+        self._index_loaded = False
+        self._index_lock = threading.Lock()
+        # 正在下载的封面，同一URL的并发请求共用一次下载
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def get_session(self):
+        """获取或创建 aiohttp session"""
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession()
+        return self.session
+
+    async def close(self):
+        """关闭 aiohttp session 和线程池"""
+        if self.session and not self.session.closed:
+            await self.session.close()
+        self._executor.shutdown(wait=False)
+
+    def _variant_path(self, digest: str, size: int) -> Path:
+        return self.cache_dir / digest[:2] / f"{digest}_{size}.jpg"
+
+    def _load_index(self):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            with open(self.cache_dir / self.INDEX_FILE, "r", encoding="utf-8") as f:
+                self._index = json.load(f)
+        except (OSError, ValueError):
+            self._index = {}
+        self._index_loaded = True
+
+    def _save_index(self):
+        tmp_path = self.cache_dir / f"{self.INDEX_FILE}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self.cache_dir / self.INDEX_FILE)
+
+    def _store(self, url: str, data: bytes) -> str:
+        """缩放并写入所有尺寸的封面，返回内容哈希（在线程池中执行）"""
+        digest = hashlib.sha1(data).hexdigest()
+        variant_dir = self.cache_dir / digest[:2]
+        variant_dir.mkdir(parents=True, exist_ok=True)
+        image = None
+        if Image is not None:
+            try:
+                image = Image.open(io.BytesIO(data))
+                image = image.convert("RGB")
+            except Exception as e:
+                print(f"解析封面失败: {e}")
+                image = None
+
+        for size in self.sizes:
+            path = self._variant_path(digest, size)
+            if path.exists():
+                continue
+            tmp_path = path.with_suffix(".tmp")
+            if image is not None:
+                variant = image.copy()
+                variant.thumbnail((size, size))
+                variant.save(tmp_path, format="JPEG", quality=85, optimize=True)
+            else:
+                tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+
+        with self._index_lock:
+            self._index[url] = digest
+            self._save_index()
+            self._evict()
+        return digest
+
+    def _evict(self):
+        """超出容量时按访问时间淘汰最旧的封面（在线程池中执行，调用方需持有索引锁）"""
+        files = []
+        total = 0
+        for path in self.cache_dir.glob("*/*.jpg"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_atime, stat.st_size, path))
+            total += stat.st_size
+        if total <= self.max_bytes:
+            return
+
+        files.sort()
+        evicted = set()
+        for _, size, path in files:
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+            evicted.add(path.name.split("_", 1)[0])
+
+        if evicted:
+            self._index = {url: digest for url, digest in self._index.items() if digest not in evicted}
+            self._save_index()
+
+    async def _fetch(self, url: str) -> Optional[str]:
+        session = await self.get_session()
+        # 封面只是卡片的点缀，下载慢时直接放弃，由调用方使用原图链接
+        async with session.get(url, timeout=aiohttp.ClientTimeout(total=self.timeout)) as resp:
+            resp.raise_for_status()
+            data = await resp.read()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._store, url, data)
+
+    async def get_cover(self, url: str, size: int) -> Optional[Path]:
+        """
+        获取指定尺寸的本地封面
+        :param url: 封面原图URL
+        :param size: 目标尺寸（需在 sizes 中）
+        :return: 本地文件路径，获取失败时返回 None
+        """
+        if not url or size not in self.sizes:
+            return None
+
+        loop = asyncio.get_running_loop()
+        if not self._index_loaded:
+            await loop.run_in_executor(self._executor, self._load_index)
+
+        digest = self._index.get(url)
+        if digest:
+            path = self._variant_path(digest, size)
+            if path.exists():
+                # 更新访问时间，供淘汰策略使用
+                await loop.run_in_executor(self._executor, os.utime, path, None)
+                return path
+
+        future = self._inflight.get(url)
+        if future is None:
+            future = loop.create_future()
+            self._inflight[url] = future
+            try:
+                future.set_result(await self._fetch(url))
+            except Exception as e:
+                print(f"获取封面失败: {url}, 错误: {e}")
+                future.set_result(None)
+            finally:
+                if not future.done():
+                    future.set_result(None)
+                self._inflight.pop(url, None)
+
+        digest = await asyncio.shield(future)
+        if not digest:
+            return None
+        return self._variant_path(digest, size)
+
+
+# 示例测试方法
+async def main():
+    cache = CoverCache(Path("data", "plugins_data", "astrbot_plugin_ikun_music", "covers"), sizes=(120, 300))
+    try:
+        url = "https://y.gtimg.cn/music/photo_new/T002R800x800M000003y8dsH2wBHlo.jpg"
+        paths = await asyncio.gather(*[cache.get_cover(url, 300) for _ in range(5)])
+        print(paths)
+        print(await cache.get_cover(url, 120))
+    finally:
+        await cache.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,74 @@
+"""
+插件导入耗时测量
+
+在独立的解释器中以 -X importtime 导入插件的各个模块，统计每个模块的累计导入耗时及其最耗时的依赖。
+
+用法（在插件目录下执行）:
+    python utils/import_time.py [模块名 ...]
+
+默认测量 main、api.wy、api.qq，例如 api.wy 会以 <插件包名>.api.wy 的形式导入。
+"""
+import re
+import subprocess
+import sys
+from pathlib import Path
+from typing import List, Tuple
+
+PLUGIN_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_MODULES = ["main", "api.wy", "api.qq"]
+
+# -X importtime 的输出格式: "import time:   self [us] | cumulative | imported package"
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure(module: str) -> Tuple[int, List[Tuple[int, str]], str]:
+    """
+    测量单个模块的导入耗时
+    :return: (累计耗时us, [(依赖累计耗时us, 依赖名)], 错误信息)
+    """
+    package = PLUGIN_DIR.name
+    target = f"{package}.{module}"
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        cwd=PLUGIN_DIR.parent,
+        capture_output=True,
+        text=True,
+    )
+
+    total = 0
+    deps = []
+    children = []
+    for line in proc.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if not match:
+            continue
+        cumulative, indent, name = int(match.group(2)), len(match.group(3)), match.group(4)
+        # 输出为后序遍历，模块的直接依赖（缩进多一级）出现在模块本身之前
+        if indent == 3:
+            children.append((cumulative, name))
+        elif indent == 1:
+            if name == target:
+                total, deps = cumulative, children
+            children = []
+
+    error = ""
+    if proc.returncode != 0:
+        error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit code {proc.returncode}"
+    deps.sort(reverse=True)
+    return total, deps, error
+
+
+def main():
+    modules = sys.argv[1:] or DEFAULT_MODULES
+    for module in modules:
+        total, deps, error = measure(module)
+        if error:
+            print(f"{module}: 导入失败 - {error}")
+            continue
+        print(f"{module}: {total / 1000:.1f} ms")
+        for cumulative, name in deps[:5]:
+            print(f"    {cumulative / 1000:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
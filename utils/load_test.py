@@ -0,0 +1,439 @@
+"""
+点歌插件压力测试
+
+在本地启动一个模拟上游（网易云搜索、歌曲详情、IKUN 播放链接接口），用模拟的消息事件驱动
+MyPlugin.search_music：大量用户分布在多个群和私聊中，按泊松到达发起点歌，看完列表后选歌或不回复直到超时。
+选歌消息经 SessionWaiter.trigger 投递，与框架分发会话消息的方式相同。
+
+定期输出吞吐、搜索/选歌延迟分位数、事件循环延迟、等待中的会话数和内存，结束时输出汇总。
+
+用法（在插件目录下执行，需要安装 AstrBot 和插件依赖）:
+    python utils/load_test.py [--rate 200] [--duration 30] [--users 5000] [--groups 300] ...
+
+插件数据写入临时目录，不影响当前目录下的 data。
+"""
+import argparse
+import asyncio
+import gc
+import hashlib
+import importlib
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+PLUGIN_DIR = Path(__file__).resolve().parent.parent
+
+
+def percentile(values: List[float], p: float) -> float:
+    """计算分位数，values 需已排序"""
+    if not values:
+        return 0.0
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+def rss_mb() -> float:
+    """当前进程常驻内存（MB），非 Linux 系统返回峰值"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class FakeUpstream:
+    """
+    模拟上游服务，运行在独立线程的事件循环中，不占用插件所在的事件循环
+    请求体不解密，相同的请求返回相同的结果
+    """
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.5, page_size: int = 5):
+        self.latency = latency
+        self.jitter = jitter
+        self.page_size = page_size
+        self.base_url = ""
+        self.requests: Counter = Counter()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._thread: Optional[threading.Thread] = None
+        self._started = threading.Event()
+
+    async def _delay(self):
+        await asyncio.sleep(self.latency * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    async def _search(self, request: web.Request) -> web.Response:
+        self.requests["search"] += 1
+        await self._delay()
+        # 请求体已加密，用加密参数生成歌曲，同一查询的结果在插件侧由缓存合并
+        body = await request.read()
+        seed = int(hashlib.md5(body).hexdigest()[:8], 16)
+        songs = [
+            {
+                "id": seed * 10 + i,
+                "name": f"歌曲{seed % 100000}-{i}",
+                "artists": [{"name": f"歌手{(seed + i) % 1000}"}],
+                "al": {"name": "专辑", "picUrl": f"{self.base_url}/cover/{seed}.jpg"},
+                "duration": 180000 + i * 1000,
+            }
+            for i in range(self.page_size)
+        ]
+        return web.json_response({"result": {"songs": songs, "songCount": 100}})
+
+    async def _detail(self, request: web.Request) -> web.Response:
+        self.requests["detail"] += 1
+        await self._delay()
+        return web.json_response({"songs": [], "code": 200})
+
+    async def _url(self, request: web.Request) -> web.Response:
+        self.requests["url"] += 1
+        await self._delay()
+        return web.json_response({"url": f"{self.base_url}/audio/{request.query.get('songId')}.mp3"})
+
+    async def _other(self, request: web.Request) -> web.Response:
+        self.requests["other"] += 1
+        return web.Response(text="ok")
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        app = web.Application()
+        app.router.add_post("/weapi/search/get", self._search)
+        app.router.add_post("/weapi/v3/song/detail", self._detail)
+        app.router.add_get("/url", self._url)
+        app.router.add_route("*", "/{tail:.*}", self._other)
+        self._runner = web.AppRunner(app, access_log=None)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        self._loop.run_until_complete(site.start())
+        self.base_url = f"http://127.0.0.1:{self._runner.addresses[0][1]}"
+        self._started.set()
+        self._loop.run_forever()
+        self._loop.run_until_complete(self._runner.cleanup())
+        self._loop.close()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="fake-upstream", daemon=True)
+        self._thread.start()
+        self._started.wait()
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+
+
+class SimUser:
+    """模拟用户，群聊中同一个群的用户共用一个会话标识（与框架默认的会话划分一致）"""
+
+    def __init__(self, user_id: int, group_id: Optional[int]):
+        self.user_id = str(user_id)
+        self.group_id = str(group_id) if group_id is not None else ""
+        if group_id is None:
+            self.session_id = f"load_test:FriendMessage:{self.user_id}"
+        else:
+            self.session_id = f"load_test:GroupMessage:{self.group_id}"
+        self.busy = False
+
+
+class LoadTestEvent:
+    """模拟消息事件，实现插件用到的 AstrMessageEvent 接口，发送的消息直接丢弃"""
+
+    def __init__(self, message: str, user: SimUser):
+        self.message_str = message
+        self.unified_msg_origin = user.session_id
+        self.user = user
+
+    def get_platform_name(self) -> str:
+        return "load_test"
+
+    def get_group_id(self) -> str:
+        return self.user.group_id
+
+    def get_sender_id(self) -> str:
+        return self.user.user_id
+
+    def is_private_chat(self) -> bool:
+        return not self.user.group_id
+
+    def get_messages(self) -> list:
+        return []
+
+    def plain_result(self, text: str) -> str:
+        return text
+
+    def chain_result(self, chain: list) -> list:
+        return chain
+
+    async def send(self, result):
+        pass
+
+
+class LoadTest:
+    """压测驱动：按泊松到达发起点歌会话，并定期统计各项指标"""
+
+    def __init__(self, plugin, upstream: FakeUpstream, args):
+        self.plugin = plugin
+        self.upstream = upstream
+        self.args = args
+        self.queries = [f"测试歌曲 {i}" for i in range(args.catalog)]
+        # 查询热度服从 Zipf 分布，少数热门歌曲占大部分请求
+        self.query_weights = [1 / (i + 1) ** args.zipf for i in range(args.catalog)]
+        self.users: List[SimUser] = []
+        for user_id in range(args.users):
+            group_id = None if random.random() < args.private_ratio else random.randrange(args.groups)
+            self.users.append(SimUser(user_id, group_id))
+
+        self.started = 0
+        self.outcomes: Counter = Counter()
+        self.active = 0
+        # 窗口内和全程的延迟样本（秒）
+        self.search_latency: List[float] = []
+        self.pick_latency: List[float] = []
+        self.loop_lag: List[float] = []
+        self.all_search: List[float] = []
+        self.all_pick: List[float] = []
+        self.all_lag: List[float] = []
+        self.window_completed = 0
+        self._tasks = set()
+
+    async def _probe_loop_lag(self, interval: float = 0.05):
+        """事件循环延迟：定时 sleep 实际唤醒时间与预期的差值"""
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(interval)
+            lag = loop.time() - start - interval
+            self.loop_lag.append(lag)
+            self.all_lag.append(lag)
+
+    async def _pick(self, user: SimUser, choice: str, state: dict):
+        """用户看完列表后回复序号，等到会话注册后再投递"""
+        from astrbot.core.utils.session_waiter import USER_SESSIONS, SessionWaiter
+
+        await asyncio.sleep(random.uniform(*self.args.think_time))
+        deadline = time.perf_counter() + self.plugin.timeout
+        while user.session_id not in USER_SESSIONS:
+            if time.perf_counter() > deadline or state["done"]:
+                return
+            await asyncio.sleep(0.02)
+        start = time.perf_counter()
+        await SessionWaiter.trigger(user.session_id, LoadTestEvent(choice, user))
+        state["picked"] = True
+        elapsed = time.perf_counter() - start
+        self.pick_latency.append(elapsed)
+        self.all_pick.append(elapsed)
+
+    async def _session(self, user: SimUser):
+        """一次完整的点歌会话：搜索 -> 选歌或超时"""
+        query = random.choices(self.queries, weights=self.query_weights)[0]
+        event = LoadTestEvent(f"music {query}", user)
+        will_pick = random.random() >= self.args.timeout_ratio
+        state = {"done": False, "picked": False}
+        pick_task = None
+        outcome = "no_result"
+        start = time.perf_counter()
+        first = True
+        self.active += 1
+        try:
+            async for result in self.plugin.search_music(event):
+                text = str(result)
+                if first:
+                    first = False
+                    elapsed = time.perf_counter() - start
+                    self.search_latency.append(elapsed)
+                    self.all_search.append(elapsed)
+                    if text.startswith("找到") and will_pick:
+                        choice = str(random.randint(1, self.plugin.page_size))
+                        pick_task = asyncio.create_task(self._pick(user, choice, state))
+                elif "超时" in text:
+                    outcome = "timeout"
+            if outcome != "timeout" and not first:
+                # 没有投递选歌却结束：同一会话中其他用户的选歌消息被这次点歌接收
+                outcome = "picked" if state["picked"] else "answered_by_other"
+            if outcome == "timeout" and will_pick:
+                # 打算选歌却超时：选歌消息被同一会话中的其他点歌抢走或投递过晚
+                outcome = "pick_missed"
+        except Exception as e:
+            outcome = f"error:{type(e).__name__}"
+        finally:
+            state["done"] = True
+            if pick_task is not None:
+                await pick_task
+            self.active -= 1
+            self.outcomes[outcome] += 1
+            self.window_completed += 1
+            user.busy = False
+
+    async def _generate(self):
+        """按泊松过程发起会话，跳过正在点歌的用户"""
+        deadline = time.perf_counter() + self.args.duration
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(random.expovariate(self.args.rate))
+            user = random.choice(self.users)
+            if user.busy:
+                self.outcomes["skipped_busy"] += 1
+                continue
+            user.busy = True
+            self.started += 1
+            task = asyncio.create_task(self._session(user))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def _report(self, elapsed: float, interval: float, baseline_rss: float, baseline_traced: int):
+        from astrbot.core.utils.session_waiter import USER_SESSIONS
+
+        search = sorted(self.search_latency)
+        pick = sorted(self.pick_latency)
+        lag = max(self.loop_lag, default=0.0)
+        memory = f"{rss_mb():7.1f}MB(+{rss_mb() - baseline_rss:.1f})"
+        if tracemalloc.is_tracing():
+            memory += f" traced +{(tracemalloc.get_traced_memory()[0] - baseline_traced) / 1024 / 1024:.1f}MB"
+        print(
+            f"{elapsed:6.1f}s  发起 {self.started:6d}  进行中 {self.active:5d}  "
+            f"吞吐 {self.window_completed / interval:7.1f}/s  "
+            f"搜索 p50/p95/p99 {percentile(search, .5) * 1000:6.1f}/{percentile(search, .95) * 1000:6.1f}/{percentile(search, .99) * 1000:6.1f}ms  "
+            f"选歌 p50/p99 {percentile(pick, .5) * 1000:6.1f}/{percentile(pick, .99) * 1000:6.1f}ms  "
+            f"循环延迟 max {lag * 1000:6.1f}ms  等待会话 {len(USER_SESSIONS):5d}  内存 {memory}  对象 {len(gc.get_objects())}"
+        )
+        self.search_latency.clear()
+        self.pick_latency.clear()
+        self.loop_lag.clear()
+        self.window_completed = 0
+
+    async def run(self):
+        interval = self.args.interval
+        gc.collect()
+        baseline_rss = rss_mb()
+        baseline_objects = len(gc.get_objects())
+        baseline_traced = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+        snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+
+        probe = asyncio.create_task(self._probe_loop_lag())
+        generator = asyncio.create_task(self._generate())
+        start = time.perf_counter()
+        # 发起结束后等待剩余会话结束（最长为选歌超时时间）
+        drain_deadline = None
+        while True:
+            await asyncio.sleep(interval)
+            self._report(time.perf_counter() - start, interval, baseline_rss, baseline_traced)
+            if generator.done():
+                if drain_deadline is None:
+                    drain_deadline = time.perf_counter() + self.plugin.timeout + 5
+                if not self._tasks or time.perf_counter() > drain_deadline:
+                    break
+        total = time.perf_counter() - start
+        probe.cancel()
+        for task in list(self._tasks):
+            task.cancel()
+
+        gc.collect()
+        search = sorted(self.all_search)
+        pick = sorted(self.all_pick)
+        lag = sorted(self.all_lag)
+        completed = sum(count for outcome, count in self.outcomes.items() if outcome != "skipped_busy")
+        print("\n==== 汇总 ====")
+        print(f"会话：发起 {self.started}，完成 {completed}，用时 {total:.1f}s，平均吞吐 {completed / total:.1f}/s")
+        print("结果：" + "，".join(f"{outcome} {count}" for outcome, count in self.outcomes.most_common()))
+        print(
+            f"搜索延迟 p50/p95/p99/max：{percentile(search, .5) * 1000:.1f}/{percentile(search, .95) * 1000:.1f}/"
+            f"{percentile(search, .99) * 1000:.1f}/{(search[-1] if search else 0) * 1000:.1f} ms"
+        )
+        print(
+            f"选歌延迟 p50/p95/p99/max：{percentile(pick, .5) * 1000:.1f}/{percentile(pick, .95) * 1000:.1f}/"
+            f"{percentile(pick, .99) * 1000:.1f}/{(pick[-1] if pick else 0) * 1000:.1f} ms"
+        )
+        print(f"事件循环延迟 p99/max：{percentile(lag, .99) * 1000:.1f}/{(lag[-1] if lag else 0) * 1000:.1f} ms")
+        print("上游请求：" + "，".join(f"{name} {count}" for name, count in self.upstream.requests.most_common()))
+        print(f"内存：常驻 {baseline_rss:.1f}MB -> {rss_mb():.1f}MB，对象 {baseline_objects} -> {len(gc.get_objects())}")
+        if snapshot is not None:
+            print("内存增长最多的代码位置：")
+            for stat in tracemalloc.take_snapshot().compare_to(snapshot, "lineno")[:10]:
+                print(f"    {stat}")
+        print()
+        print(self.plugin.format_stats())
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="点歌插件压力测试")
+    parser.add_argument("--rate", type=float, default=200, help="每秒发起的点歌会话数")
+    parser.add_argument("--duration", type=float, default=30, help="发起会话的持续时间（秒）")
+    parser.add_argument("--users", type=int, default=5000, help="模拟用户数")
+    parser.add_argument("--groups", type=int, default=300, help="模拟群数")
+    parser.add_argument("--private-ratio", type=float, default=0.3, help="私聊用户比例")
+    parser.add_argument("--timeout-ratio", type=float, default=0.1, help="不回复序号、等待超时的会话比例")
+    parser.add_argument("--think-time", type=float, nargs=2, default=(0.5, 3.0), help="用户看列表的时间范围（秒）")
+    parser.add_argument("--wait-timeout", type=int, default=10, help="插件等待选歌的超时时间（秒）")
+    parser.add_argument("--catalog", type=int, default=2000, help="不同查询的数量")
+    parser.add_argument("--zipf", type=float, default=1.0, help="查询热度的 Zipf 指数")
+    parser.add_argument("--upstream-latency", type=float, default=0.05, help="模拟上游的平均响应时间（秒）")
+    parser.add_argument("--max-concurrency", type=int, default=8, help="插件最大并发上游请求数")
+    parser.add_argument("--interval", type=float, default=2.0, help="统计输出间隔（秒）")
+    parser.add_argument("--tracemalloc", action="store_true", help="用 tracemalloc 统计内存增长位置（会明显变慢）")
+    parser.add_argument("--verbose", action="store_true", help="输出插件的 INFO 日志")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子")
+    return parser.parse_args(argv)
+
+
+async def run(args):
+    upstream = FakeUpstream(latency=args.upstream_latency)
+    upstream.start()
+
+    # 以包的形式导入插件，插件的相对路径数据目录写入临时目录
+    sys.path.insert(0, str(PLUGIN_DIR.parent))
+    workdir = tempfile.TemporaryDirectory(prefix="ikun_music_load_")
+    cwd = os.getcwd()
+    os.chdir(workdir.name)
+    plugin = None
+    try:
+        # 先初始化 astrbot，避免循环导入
+        from astrbot.api import logger
+        if not args.verbose:
+            logger.setLevel(logging.WARNING)
+        plugin_main = importlib.import_module(f"{PLUGIN_DIR.name}.main")
+        config: Dict = {
+            "api_url": upstream.base_url,
+            "api_key": "load_test",
+            "music_source": "wy",
+            "send_mode": "text",
+            "timeout": args.wait_timeout,
+            "max_concurrency": args.max_concurrency,
+            # 压测时开启看门狗，在状态报告中查看阻塞位置
+            "watchdog_threshold": 0.1,
+        }
+        plugin = plugin_main.MyPlugin(None, config)
+        plugin.api.BASE_URL = upstream.base_url
+        print(
+            f"模拟上游 {upstream.base_url}，{args.users} 个用户 / {args.groups} 个群，"
+            f"每秒 {args.rate} 个会话，持续 {args.duration}s"
+        )
+        await LoadTest(plugin, upstream, args).run()
+    finally:
+        if plugin is not None:
+            await plugin.terminate()
+        os.chdir(cwd)
+        workdir.cleanup()
+        upstream.stop()
+
+
+# 示例测试方法
+def main():
+    args = parse_args()
+    if args.seed is not None:
+        random.seed(args.seed)
+    if args.tracemalloc:
+        tracemalloc.start()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import asyncio
+import logging
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+
+class QueueBudgetExceeded(Exception):
+    """预下载文件总大小超过上限"""
+
+
+class PlayQueueManager:
+    """
+    群点歌队列
+    每个群（或私聊）一个队列，在后台提前下载队首的若干首歌曲，
+    取下一首时如果已下载完成则直接使用本地文件，播放后的文件自动清理。
+    """
+
+    def __init__(
+        self,
+        download_dir: Path,
+        download: Callable[[dict, Path, Callable[[int], None]], Awaitable[Optional[Path]]],
+        lookahead: int = 2,
+        max_tracks: int = 50,
+        max_bytes: int = 200 * 1024 * 1024,
+        estimated_track_bytes: int = 30 * 1024 * 1024,
+        logger: logging.Logger = None,
+    ):
+        """
+        :param download_dir: 预下载文件存放目录
+        :param download: 下载协程函数，参数为歌曲、不含后缀的目标路径和写入计数回调（每写入一块调用一次，
+                         超出总大小上限时抛出 QueueBudgetExceeded），返回实际写入的文件路径，失败返回 None
+        :param lookahead: 每个队列提前下载的歌曲数量
+        :param max_tracks: 每个队列的最大歌曲数量
+        :param max_bytes: 所有队列预下载文件（含下载中的部分）的总大小上限
+        :param estimated_track_bytes: 还没有完成的下载时估计的单首歌曲大小，用于限制同时开始的下载数
+        """
+        self.download_dir = Path(download_dir)
+        self.download = download
+        self.lookahead = lookahead
+        self.max_tracks = max_tracks
+        self.max_bytes = max_bytes
+        self.logger = logger or logging.getLogger(__name__)
+        # 队列ID -> 歌曲列表，每项为 {"song": 歌曲, "task": 下载任务, "path": 本地文件}
+        self.queues: Dict[str, List[dict]] = {}
+        # 磁盘上的预下载文件大小，包含下载中已写入的部分
+        self._bytes = 0
+        # 下载中的歌曲数，按估计大小预留空间
+        self._downloading = 0
+        self._estimate = estimated_track_bytes
+        self._completed = 0
+        self._seq = 0
+        self._prepared: Optional[asyncio.Future] = None
+
+    def add(self, queue_id: str, song: dict) -> int:
+        """
+        添加歌曲到队列
+        :return: 歌曲在队列中的位置（从1开始），队列已满返回 0
+        """
+        queue = self.queues.setdefault(queue_id, [])
+        if len(queue) >= self.max_tracks:
+            return 0
+        queue.append({"song": song, "task": None, "path": None})
+        self._schedule(queue_id)
+        return len(queue)
+
+    def tracks(self, queue_id: str) -> List[dict]:
+        """返回队列中的歌曲，每项为 {"song": 歌曲, "ready": 是否已下载}"""
+        return [
+            {"song": track["song"], "ready": track["path"] is not None}
+            for track in self.queues.get(queue_id, [])
+        ]
+
+    def next(self, queue_id: str) -> Optional[dict]:
+        """
+        取出队首歌曲，未下载完成的歌曲放弃预下载
+        :return: {"song": 歌曲, "path": 本地文件或 None}，队列为空时返回 None
+        """
+        queue = self.queues.get(queue_id)
+        if not queue:
+            return None
+        track = queue.pop(0)
+        if not queue:
+            del self.queues[queue_id]
+        if track["task"] and not track["task"].done():
+            track["task"].cancel()
+        self._schedule(queue_id)
+        return {"song": track["song"], "path": track["path"]}
+
+    def clear(self, queue_id: str):
+        """清空队列并删除已下载的文件"""
+        for track in self.queues.pop(queue_id, []):
+            if track["task"] and not track["task"].done():
+                track["task"].cancel()
+            self.discard(track["path"])
+
+    def discard(self, path: Optional[Path]):
+        """删除已播放或已放弃的预下载文件，释放的空间用于其他队列的预下载"""
+        if path is None:
+            return
+        try:
+            self._bytes -= path.stat().st_size
+            path.unlink()
+        except OSError:
+            pass
+        self._schedule_all()
+
+    def _clean(self):
+        """创建预下载目录并删除上次运行遗留的预下载文件（阻塞操作，在线程中执行）"""
+        self.download_dir.mkdir(parents=True, exist_ok=True)
+        for path in self.download_dir.glob("track_*"):
+            if path.is_file():
+                path.unlink(missing_ok=True)
+
+    async def prepare(self):
+        """清理上次运行遗留的文件（只执行一次），预下载开始前都会等待清理完成"""
+        if self._prepared is None:
+            self._prepared = asyncio.ensure_future(asyncio.to_thread(self._clean))
+        await asyncio.shield(self._prepared)
+
+    async def close(self):
+        for queue_id in list(self.queues):
+            self.clear(queue_id)
+
+    def _has_room(self) -> bool:
+        """已占用空间加上下载中歌曲的预留空间未超过上限"""
+        return self._bytes + self._downloading * self._estimate < self.max_bytes
+
+    def _schedule(self, queue_id: str):
+        """为队首的若干首歌曲启动预下载"""
+        for track in self.queues.get(queue_id, [])[: self.lookahead]:
+            if track["task"] is None and self._has_room():
+                self._downloading += 1
+                track["task"] = asyncio.create_task(self._prefetch(queue_id, track))
+
+    def _schedule_all(self):
+        """空间释放后，为因空间不足而跳过的歌曲补充预下载"""
+        for queue_id in list(self.queues):
+            if not self._has_room():
+                break
+            self._schedule(queue_id)
+
+    async def _prefetch(self, queue_id: str, track: dict):
+        if self._bytes >= self.max_bytes:
+            # 任务创建后其他下载已占满空间，等空间释放后重新调度
+            self._downloading -= 1
+            track["task"] = None
+            return
+        self._seq += 1
+        target = self.download_dir / f"track_{self._seq}"
+        written = 0
+
+        def on_chunk(size: int):
+            nonlocal written
+            written += size
+            self._bytes += size
+            if self._bytes > self.max_bytes:
+                raise QueueBudgetExceeded()
+
+        path = None
+        try:
+            await self.prepare()
+            path = await self.download(track["song"], target, on_chunk)
+        except BaseException as e:
+            # 取消、空间不足或下载失败时删除已写入的部分
+            self._bytes -= written
+            for partial in self.download_dir.glob(f"{target.name}.*"):
+                partial.unlink(missing_ok=True)
+            if isinstance(e, QueueBudgetExceeded):
+                # 等其他文件释放空间后重新下载
+                track["task"] = None
+            elif isinstance(e, Exception):
+                self.logger.warning(f"预下载歌曲失败: {e}")
+            else:
+                raise
+            return
+        finally:
+            self._downloading -= 1
+
+        if path is None:
+            return
+        self._completed += 1
+        self._estimate += (written - self._estimate) / min(self._completed, 20)
+        # 下载期间歌曲可能已被取出或队列被清空
+        if any(item is track for item in self.queues.get(queue_id, [])):
+            track["path"] = path
+        else:
+            self.discard(path)
@@ -0,0 +1,149 @@
+import time
+from typing import Dict, List, Optional
+
+# XML 转义表，str.translate 一次遍历完成所有替换
+XML_ESCAPE_TABLE = str.maketrans({
+    "&": "&amp;",
+    "<": "&lt;",
+    ">": "&gt;",
+    '"': "&quot;",
+    "'": "&apos;",
+})
+
+# 搜索结果列表中的单行，序号在渲染时拼接
+SONG_LINE_TEMPLATE = "{title} - {artist} ({duration})"
+
+# 文本模式发送的歌曲信息
+SONG_TEXT_TEMPLATE = "🎶 {title} - {artist}\n⏰ 时长: {duration}\n"
+SONG_TEXT_URL_TEMPLATE = "🔗 播放链接：{url}\n"
+SONG_TEXT_NO_URL = "❌ 未能获取播放链接\n"
+SONG_TEXT_SOURCE_TEMPLATE = "📻 来源: {source}"
+
+# 微信音乐卡片
+WECHAT_MUSIC_XML_TEMPLATE = (
+    '<msg><appmsg appid="" sdkver="0x70900000"><title>{title}</title><des>{artist}</des>'
+    "<action>view</action><type>3</type><showtype>0</showtype><soundtype>1</soundtype>"
+    "<mediatagname></mediatagname><messageext></messageext><messageaction></messageaction>"
+    "<content></content><contentattr>0</contentattr><url>{url}</url><lowurl></lowurl>"
+    "<dataurl>{audio_url}</dataurl><lowdataurl></lowdataurl><songalbumurl></songalbumurl>"
+    "<songlyric></songlyric><mediadataurl></mediadataurl><weburl></weburl>"
+    "<autostart>false</autostart><headerstyle>0</headerstyle></appmsg></msg>"
+)
+
+
+def xml_escape(value) -> str:
+    """转义 XML 特殊字符"""
+    return "" if value is None else str(value).translate(XML_ESCAPE_TABLE)
+
+
+def format_time(duration_ms):
+    """格式化歌曲时长"""
+    duration = duration_ms // 1000
+
+    hours = duration // 3600
+    minutes = (duration % 3600) // 60
+    seconds = duration % 60
+
+    if hours > 0:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    else:
+        return f"{minutes:02d}:{seconds:02d}"
+
+
+class MessageRenderer:
+    """
+    消息渲染
+    模板预先定义，按音乐源和歌曲ID缓存渲染好的片段，相同歌曲重复出现时不再拼接字符串
+    片段缓存超过 maxsize 时整体清空
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self._song_lines: Dict[tuple, str] = {}
+        self._song_texts: Dict[tuple, str] = {}
+        self._wechat_titles: Dict[tuple, tuple] = {}
+
+    def _remember(self, cache: dict, key: tuple, value):
+        if len(cache) >= self.maxsize:
+            cache.clear()
+        cache[key] = value
+
+    def song_line(self, source: str, song: dict) -> str:
+        """渲染搜索结果中的一行（不含序号）"""
+        key = (source, song["id"])
+        line = self._song_lines.get(key)
+        if line is None:
+            line = SONG_LINE_TEMPLATE.format(
+                title=song["title"],
+                artist=song["artist"],
+                duration=format_time(song["duration"]),
+            )
+            self._remember(self._song_lines, key, line)
+        return line
+
+    def song_list(self, source: str, songs: List[dict]) -> str:
+        """渲染搜索结果列表"""
+        return "\n".join(f"{i}. {self.song_line(source, song)}" for i, song in enumerate(songs, 1))
+
+    def song_text(self, source: str, source_name: str, song: dict, audio_url: Optional[str]) -> str:
+        """渲染文本模式的歌曲信息"""
+        key = (source, song["id"])
+        head = self._song_texts.get(key)
+        if head is None:
+            head = SONG_TEXT_TEMPLATE.format(
+                title=song.get("title", "未知歌曲"),
+                artist=song.get("artist", "未知歌手"),
+                duration=format_time(song.get("duration", 0)),
+            )
+            self._remember(self._song_texts, key, head)
+        url_text = SONG_TEXT_URL_TEMPLATE.format(url=audio_url) if audio_url else SONG_TEXT_NO_URL
+        return head + url_text + SONG_TEXT_SOURCE_TEMPLATE.format(source=source_name)
+
+    def wechat_music_xml(self, source: str, song: dict, url: str, audio_url: str) -> str:
+        """渲染微信音乐卡片 XML，所有字段均做 XML 转义"""
+        key = (source, song["id"])
+        escaped = self._wechat_titles.get(key)
+        if escaped is None:
+            escaped = (xml_escape(song.get("title")), xml_escape(song.get("artist")))
+            self._remember(self._wechat_titles, key, escaped)
+        return WECHAT_MUSIC_XML_TEMPLATE.format(
+            title=escaped[0],
+            artist=escaped[1],
+            url=xml_escape(url),
+            audio_url=xml_escape(audio_url),
+        )
+
+
+# 示例测试方法：渲染性能对比
+def main():
+    songs = [
+        {"id": i, "title": f"歌曲 <{i}> & 伴奏", "artist": "歌手甲、歌手乙", "duration": 180000 + i * 1000}
+        for i in range(30)
+    ]
+    rounds = 20000
+    renderer = MessageRenderer()
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        "\n".join(
+            f"{i + 1}. {song['title']} - {song['artist']} ({format_time(song['duration'])})"
+            for i, song in enumerate(songs)
+        )
+    naive = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        renderer.song_list("wy", songs)
+    cached = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        renderer.wechat_music_xml("wy", songs[0], "https://music.163.com/#/song?id=0", "http://example.com/a.flac?x=1&y=2")
+    xml = time.perf_counter() - start
+
+    print(f"搜索列表（{len(songs)} 首 x {rounds} 次）：逐项拼接 {naive * 1000:.0f} ms，缓存片段 {cached * 1000:.0f} ms")
+    print(f"微信卡片 XML（{rounds} 次）：{xml * 1000:.0f} ms，每次 {xml / rounds * 1e6:.1f} us")
+
+
+if __name__ == "__main__":
+    main()
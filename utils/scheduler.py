@@ -0,0 +1,166 @@
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Union
+
+# 任务优先级，数值越小越优先
+INTERACTIVE = 0  # 用户选歌后的发送
+SEARCH = 1  # 用户搜索
+PREFETCH = 2  # 预取、预热
+BULK = 3  # 歌单导入等批量任务
+
+PRIORITY_NAMES = {
+    INTERACTIVE: "interactive",
+    SEARCH: "search",
+    PREFETCH: "prefetch",
+    BULK: "bulk",
+}
+
+
+class Ticket:
+    """
+    可提升优先级的调度凭据
+    多个调用方共享同一个请求时，后加入的调用方可以提升请求的优先级，排队中的请求会移到新的优先级队列
+    """
+
+    def __init__(self, priority: int):
+        self.priority = priority
+        self._scheduler: Optional["PriorityScheduler"] = None
+        self._future: Optional[asyncio.Future] = None
+
+    def escalate(self, priority: int):
+        """提升到更高的优先级（数值更小），已开始执行的请求不受影响"""
+        if priority >= self.priority:
+            return
+        old, self.priority = self.priority, priority
+        if self._scheduler is not None and self._future is not None and not self._future.done():
+            self._scheduler._move(self._future, old, priority)
+
+
+class PriorityScheduler:
+    """
+    出站请求优先级调度器
+    按优先级分配并发名额，每个优先级有独立的并发上限；
+    交互请求延迟升高时，暂缓启动预取和批量任务，直到交互请求全部完成。
+    """
+
+    DEFAULT_LIMITS = {
+        INTERACTIVE: 8,
+        SEARCH: 6,
+        PREFETCH: 2,
+        BULK: 1,
+    }
+
+    def __init__(
+        self,
+        total: int = 8,
+        limits: Optional[Dict[int, int]] = None,
+        latency_threshold: float = 3.0,
+        alpha: float = 0.2,
+    ):
+        self.total = total
+        self.limits = {**self.DEFAULT_LIMITS, **(limits or {})}
+        self.latency_threshold = latency_threshold
+        self.alpha = alpha
+        self.running: Dict[int, int] = {priority: 0 for priority in self.limits}
+        self.completed: Dict[int, int] = {priority: 0 for priority in self.limits}
+        self.deferred = 0
+        # 交互请求耗时的指数加权平均值（秒）
+        self.interactive_latency = 0.0
+        self._waiters: Dict[int, Deque[asyncio.Future]] = {priority: deque() for priority in self.limits}
+
+    def _background_paused(self) -> bool:
+        """交互请求仍在进行且延迟偏高时，暂缓后台任务"""
+        interactive_active = self.running[INTERACTIVE] > 0 or len(self._waiters[INTERACTIVE]) > 0
+        return interactive_active and self.interactive_latency > self.latency_threshold
+
+    def _can_start(self, priority: int) -> bool:
+        if sum(self.running.values()) >= self.total:
+            return False
+        if self.running[priority] >= self.limits[priority]:
+            return False
+        if priority >= PREFETCH and self._background_paused():
+            return False
+        return True
+
+    def _dispatch(self):
+        """按优先级唤醒等待中的任务，结果为分配名额的优先级"""
+        for priority in sorted(self._waiters):
+            waiters = self._waiters[priority]
+            while waiters and self._can_start(priority):
+                future = waiters.popleft()
+                if not future.done():
+                    self.running[priority] += 1
+                    future.set_result(priority)
+
+    def _move(self, future: asyncio.Future, old: int, new: int):
+        """排队中的任务改到新的优先级队列"""
+        try:
+            self._waiters[old].remove(future)
+        except ValueError:
+            return
+        self._waiters[new].append(future)
+        self._dispatch()
+
+    async def _acquire(self, ticket: Ticket) -> int:
+        """等待分配名额，返回分配名额时的优先级"""
+        priority = ticket.priority
+        # 有更高或同等优先级的任务在排队时，不插队
+        queued = any(self._waiters[p] for p in self._waiters if p <= priority)
+        if not queued and self._can_start(priority):
+            self.running[priority] += 1
+            return priority
+
+        if priority >= PREFETCH and self._background_paused():
+            self.deferred += 1
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[priority].append(future)
+        ticket._scheduler, ticket._future = self, future
+        try:
+            return await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已分配名额但任务被取消，归还名额
+                self._release(future.result())
+            elif future in self._waiters[ticket.priority]:
+                self._waiters[ticket.priority].remove(future)
+            raise
+        finally:
+            ticket._scheduler = ticket._future = None
+
+    def _release(self, priority: int):
+        self.running[priority] -= 1
+        self._dispatch()
+
+    async def run(self, priority: Union[int, Ticket], func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """
+        在调度器中执行协程函数
+        :param priority: 任务优先级 INTERACTIVE/SEARCH/PREFETCH/BULK，或可提升优先级的 Ticket
+        :param func: 协程函数
+        """
+        ticket = priority if isinstance(priority, Ticket) else Ticket(priority)
+        granted = await self._acquire(ticket)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            if granted == INTERACTIVE:
+                elapsed = loop.time() - start
+                self.interactive_latency += self.alpha * (elapsed - self.interactive_latency)
+            self.completed[granted] += 1
+            self._release(granted)
+
+    def stats(self) -> dict:
+        return {
+            "interactive_latency": self.interactive_latency,
+            "deferred": self.deferred,
+            "classes": {
+                PRIORITY_NAMES[priority]: {
+                    "running": self.running[priority],
+                    "waiting": len(self._waiters[priority]),
+                    "completed": self.completed[priority],
+                    "limit": self.limits[priority],
+                }
+                for priority in sorted(self.limits)
+            },
+        }
@@ -0,0 +1,53 @@
+import importlib
+from typing import Protocol, runtime_checkable
+
+# 音乐源注册表：音乐源代码 -> (显示名称, 适配器所在模块和类名（相对插件包）)，适配器首次使用时才导入
+# 新增音乐源时在此登记，并同步 _conf_schema.json 中 music_source 的 options（配置界面只能读取静态文件）
+SOURCE_ADAPTERS = {
+    "wy": ("网易云音乐", "api.wy:NetEaseMusicAPI"),
+    "qq": ("QQ音乐", "api.qq:QQMusicAPI"),
+}
+
+# 音乐源代码 -> 显示名称
+SOURCE_NAMES = {source: name for source, (name, _) in SOURCE_ADAPTERS.items()}
+
+
+@runtime_checkable
+class MusicSource(Protocol):
+    """
+    音乐源适配器协议
+    CAPABILITIES 声明适配器支持的功能：
+      search: 支持的搜索类型，如 ("music", "album", "artist", "playlist")
+      batch_details: 是否支持 get_song_details 批量获取歌曲详情
+      lyrics: 是否支持获取歌词
+      card_metadata_remote: card_metadata 是否需要请求上游（是则缓存结果，否则直接由搜索结果生成）
+    """
+
+    SOURCE: str  # 音乐源代码
+    IKUN_SOURCE: str  # IKUN 音源 /url 接口的 source 参数
+    CARD_TYPE: str  # 音乐卡片类型
+    CAPABILITIES: dict
+
+    async def get_session(self): ...
+
+    async def close(self): ...
+
+    async def search_music(self, query: str, page: int) -> dict: ...
+
+    async def get_media_source(self, song_id: str, quality: str = "high") -> dict: ...
+
+    async def card_metadata(self, song: dict) -> dict: ...
+
+
+def load_source(source: str, **config) -> MusicSource:
+    """按音乐源代码导入并创建适配器"""
+    if source not in SOURCE_ADAPTERS:
+        raise ValueError(f"不支持的音乐源：{source}")
+    module_name, class_name = SOURCE_ADAPTERS[source][1].split(":")
+    module = importlib.import_module(f"..{module_name}", __package__)
+    return getattr(module, class_name)(**config)
+
+
+def supports(api: MusicSource, capability: str) -> bool:
+    """判断适配器是否支持某项功能"""
+    return bool(getattr(api, "CAPABILITIES", {}).get(capability))
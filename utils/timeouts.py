@@ -0,0 +1,126 @@
+import asyncio
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+
+class AdaptiveTimeout:
+    """
+    单个接口的自适应超时
+    按请求耗时的指数加权平均值和平均偏差估计超时：平均值 + k * 偏差，限制在 [floor, ceiling] 内；
+    超时的请求不计入样本，下一次超时时间翻倍（直到 ceiling），收到成功响应后恢复为估计值。
+    """
+
+    def __init__(
+        self,
+        floor: float = 1.0,
+        ceiling: float = 15.0,
+        k: float = 4.0,
+        alpha: float = 0.125,
+        beta: float = 0.25,
+    ):
+        self.floor = floor
+        self.ceiling = ceiling
+        self.k = k
+        self.alpha = alpha
+        self.beta = beta
+        # 耗时平均值和平均偏差（秒），没有样本时为 None
+        self.mean = None
+        self.deviation = 0.0
+        self.samples = 0
+        self.timeouts = 0
+        self._backoff = 1
+
+    @property
+    def value(self) -> float:
+        """当前超时时间（秒），没有样本时使用上限，避免误伤首次较慢的请求"""
+        if self.mean is None:
+            return self.ceiling
+        estimate = max(self.floor, min(self.mean + self.k * self.deviation, self.ceiling))
+        return min(estimate * self._backoff, self.ceiling)
+
+    def observe(self, elapsed: float):
+        """记录一次成功请求的耗时"""
+        if self.mean is None:
+            self.mean = elapsed
+            self.deviation = elapsed / 2
+        else:
+            self.deviation += self.beta * (abs(elapsed - self.mean) - self.deviation)
+            self.mean += self.alpha * (elapsed - self.mean)
+        self.samples += 1
+        self._backoff = 1
+
+    def expire(self):
+        """记录一次超时"""
+        self.timeouts += 1
+        self._backoff = min(self._backoff * 2, 64)
+
+    def stats(self) -> dict:
+        return {
+            "timeout": self.value,
+            "mean": self.mean or 0.0,
+            "deviation": self.deviation,
+            "samples": self.samples,
+            "timeouts": self.timeouts,
+        }
+
+
+class AdaptiveTimeouts:
+    """按接口名称管理自适应超时，各接口的超时独立估计"""
+
+    def __init__(self, floor: float = 1.0, ceiling: float = 15.0, k: float = 4.0):
+        self.floor = floor
+        self.ceiling = max(ceiling, floor)
+        self.k = k
+        self.endpoints: Dict[str, AdaptiveTimeout] = {}
+
+    def _get(self, endpoint: str) -> AdaptiveTimeout:
+        timeout = self.endpoints.get(endpoint)
+        if timeout is None:
+            timeout = self.endpoints[endpoint] = AdaptiveTimeout(self.floor, self.ceiling, self.k)
+        return timeout
+
+    def get(self, endpoint: str) -> float:
+        """接口当前的超时时间（秒）"""
+        return self._get(endpoint).value
+
+    @contextmanager
+    def measure(self, endpoint: str) -> Iterator[float]:
+        """
+        给出接口当前的超时时间，并记录本次请求的结果：
+        正常结束时记录耗时，抛出 asyncio.TimeoutError 时记录超时，其他异常不计入
+        """
+        timeout = self._get(endpoint)
+        start = time.perf_counter()
+        try:
+            yield timeout.value
+        except asyncio.TimeoutError:
+            timeout.expire()
+            raise
+        else:
+            timeout.observe(time.perf_counter() - start)
+
+    def stats(self) -> Dict[str, dict]:
+        return {endpoint: timeout.stats() for endpoint, timeout in sorted(self.endpoints.items())}
+
+
+# 示例测试方法
+def main():
+    import random
+
+    timeout = AdaptiveTimeout(floor=0.5, ceiling=15.0)
+    for _ in range(200):
+        timeout.observe(random.gauss(0.3, 0.05))
+    print(f"稳定 0.3s 左右：超时 {timeout.value:.2f}s（平均 {timeout.mean:.3f}s ± {timeout.deviation:.3f}s）")
+    for _ in range(20):
+        timeout.observe(random.uniform(1.0, 3.0))
+    print(f"上游变慢到 1~3s：超时 {timeout.value:.2f}s（平均 {timeout.mean:.3f}s ± {timeout.deviation:.3f}s）")
+    for _ in range(3):
+        timeout.expire()
+        print(f"连续超时 {timeout.timeouts} 次：超时 {timeout.value:.2f}s")
+    timeout.observe(0.3)
+    print(f"恢复后：超时 {timeout.value:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+import heapq
+import random
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+
+class SpaceSaving:
+    """
+    带时间衰减的 Space-Saving 流式 Top-K 计数器
+    最多跟踪 capacity 个键，超出时替换计数最小的键；计数按半衰期指数衰减。
+    衰减通过放大新事件的权重实现，更新时无需遍历已有计数。
+    """
+
+    # 权重放大超过该值时统一缩放，避免浮点溢出
+    RESCALE_THRESHOLD = 1e12
+
+    def __init__(self, capacity: int = 100, half_life: float = 7 * 24 * 3600):
+        self.capacity = capacity
+        self.half_life = half_life
+        self.base_time = time.time()
+        self.counts: Dict[Hashable, float] = {}
+        # 最小堆，元素为 (计数, 键)，计数变化后旧元素留在堆中，出堆时跳过
+        self._heap: List[Tuple[float, Hashable]] = []
+
+    def __len__(self):
+        return len(self.counts)
+
+    def _weight(self, now: float) -> float:
+        return 2 ** ((now - self.base_time) / self.half_life)
+
+    def _rescale(self, now: float):
+        factor = self._weight(now)
+        self.base_time = now
+        self.counts = {key: count / factor for key, count in self.counts.items()}
+        self._rebuild_heap()
+
+    def _rebuild_heap(self):
+        self._heap = [(count, key) for key, count in self.counts.items()]
+        heapq.heapify(self._heap)
+
+    def _pop_min(self) -> Tuple[Hashable, float]:
+        while True:
+            count, key = heapq.heappop(self._heap)
+            if self.counts.get(key) == count:
+                return key, count
+
+    def add(self, key: Hashable, now: Optional[float] = None) -> Optional[Hashable]:
+        """
+        记录一次事件
+        :return: 被替换出去的键，没有则返回 None
+        """
+        now = time.time() if now is None else now
+        weight = self._weight(now)
+        if weight > self.RESCALE_THRESHOLD:
+            self._rescale(now)
+            weight = 1.0
+
+        evicted = None
+        if key in self.counts:
+            count = self.counts[key] + weight
+        elif len(self.counts) < self.capacity:
+            count = weight
+        else:
+            # 继承被替换键的计数，保证估计值不低于真实值
+            evicted, min_count = self._pop_min()
+            del self.counts[evicted]
+            count = min_count + weight
+
+        self.counts[key] = count
+        heapq.heappush(self._heap, (count, key))
+        if len(self._heap) > 4 * self.capacity:
+            self._rebuild_heap()
+        return evicted
+
+    def top(self, n: int = 10, now: Optional[float] = None) -> List[Tuple[Hashable, float]]:
+        """返回衰减后计数最高的 n 个键"""
+        now = time.time() if now is None else now
+        factor = self._weight(now)
+        return [(key, count / factor) for key, count in heapq.nlargest(n, self.counts.items(), key=lambda item: item[1])]
+
+    def dump(self) -> dict:
+        return {"base_time": self.base_time, "counts": [[key, count] for key, count in self.counts.items()]}
+
+    def load(self, data: dict):
+        self.base_time = data.get("base_time", time.time())
+        self.counts = {key: count for key, count in data.get("counts", [])[: self.capacity]}
+        self._rebuild_heap()
+
+
+class HotSongs:
+    """
+    点歌热度榜
+    按群和全局分别维护 Top-K 计数器，群的数量超过上限时淘汰最久未点歌的群
+    """
+
+    GLOBAL = "__global__"
+
+    def __init__(self, capacity: int = 100, half_life: float = 7 * 24 * 3600, max_groups: int = 1024):
+        self.capacity = capacity
+        self.half_life = half_life
+        self.max_groups = max_groups
+        self.counters: "OrderedDict[str, SpaceSaving]" = OrderedDict()
+        # 键 -> 歌曲信息，只保留仍被某个计数器跟踪的歌曲
+        self.songs: Dict[str, dict] = {}
+        # 键 -> 跟踪该键的计数器数量
+        self._refs: Dict[str, int] = {}
+        self.dirty = False
+
+    def _counter(self, group: str) -> SpaceSaving:
+        counter = self.counters.get(group)
+        if counter is None:
+            counter = self.counters[group] = SpaceSaving(self.capacity, self.half_life)
+            if len(self.counters) > self.max_groups:
+                for name in self.counters:
+                    if name != self.GLOBAL:
+                        for key in self.counters.pop(name).counts:
+                            self._release(key)
+                        break
+        self.counters.move_to_end(group)
+        return counter
+
+    def _release(self, key: str):
+        refs = self._refs.get(key, 0) - 1
+        if refs > 0:
+            self._refs[key] = refs
+        else:
+            self._refs.pop(key, None)
+            self.songs.pop(key, None)
+
+    def _add(self, counter: SpaceSaving, key: str, now: Optional[float]):
+        if key not in counter.counts:
+            self._refs[key] = self._refs.get(key, 0) + 1
+        evicted = counter.add(key, now)
+        if evicted is not None:
+            self._release(evicted)
+
+    def record(self, key: str, song: Any, group: Optional[str] = None, now: Optional[float] = None):
+        """记录一次点歌"""
+        self.songs[key] = song
+        self._add(self._counter(self.GLOBAL), key, now)
+        if group:
+            self._add(self._counter(group), key, now)
+        self.dirty = True
+
+    def top(self, group: Optional[str] = None, n: int = 10) -> List[Tuple[Any, float]]:
+        """返回群（不指定时为全局）点歌次数最多的歌曲及其衰减后的次数"""
+        counter = self.counters.get(group or self.GLOBAL)
+        if counter is None:
+            return []
+        return [(self.songs[key], count) for key, count in counter.top(n) if key in self.songs]
+
+    def dump(self) -> dict:
+        self.dirty = False
+        return {
+            "counters": {group: counter.dump() for group, counter in self.counters.items()},
+            "songs": dict(self.songs),
+        }
+
+    def load(self, data: dict):
+        for group, counter_data in data.get("counters", {}).items():
+            counter = SpaceSaving(self.capacity, self.half_life)
+            counter.load(counter_data)
+            self.counters[group] = counter
+        self._refs = {}
+        for counter in self.counters.values():
+            for key in counter.counts:
+                self._refs[key] = self._refs.get(key, 0) + 1
+        self.songs = {key: song for key, song in data.get("songs", {}).items() if key in self._refs}
+
+
+# 示例测试方法：一百万次点歌事件的吞吐量
+def main():
+    events = 1_000_000
+    hot = HotSongs(capacity=100)
+    rng = random.Random(0)
+    # 近似 Zipf 分布的歌曲热度，分布在 200 个群中
+    keys = [f"wy:{int(rng.paretovariate(1.1))}" for _ in range(events)]
+    groups = [str(rng.randrange(200)) for _ in range(events)]
+    song = {"title": "", "artist": ""}
+
+    start = time.perf_counter()
+    now = time.time()
+    for i in range(events):
+        hot.record(keys[i], song, groups[i], now + i * 0.01)
+    elapsed = time.perf_counter() - start
+
+    print(f"{events} 次事件耗时 {elapsed:.2f}s，{events / elapsed:,.0f} 次/秒")
+    print("全局热度前五：", [key for key, _ in hot.counters[HotSongs.GLOBAL].top(5)])
+
+
+if __name__ == "__main__":
+    main()
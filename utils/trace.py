@@ -0,0 +1,118 @@
+import json
+import os
+import random
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Deque, List, Optional
+
+# 当前协程所属的请求追踪
+current_trace: ContextVar[Optional["Trace"]] = ContextVar("ikun_music_trace", default=None)
+
+
+class Trace:
+    """一次点歌请求的追踪，记录搜索、等待选择、获取链接、发送等各阶段耗时"""
+
+    # 等待用户操作的阶段，不计入处理耗时
+    IDLE_SPANS = {"wait"}
+
+    def __init__(self, command: str, **attrs):
+        self.trace_id = uuid.uuid4().hex[:12]
+        self.command = command
+        self.attrs = attrs
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration = 0.0
+        # 每个阶段为 [名称, 相对开始时间的偏移(秒), 耗时(秒)]
+        self.spans: List[list] = []
+
+    def add_span(self, name: str, start: float, end: float):
+        """记录一个阶段，start/end 为 time.perf_counter() 的值"""
+        self.spans.append([name, round(start - self._start, 4), round(end - start, 4)])
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._start
+
+    @property
+    def active_duration(self) -> float:
+        """扣除等待用户操作后的处理耗时"""
+        return self.duration - sum(item[2] for item in self.spans if item[0] in self.IDLE_SPANS)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "command": self.command,
+            "start_time": self.start_time,
+            "duration": round(self.duration, 4),
+            "active": round(self.active_duration, 4),
+            "attrs": self.attrs,
+            "spans": self.spans,
+        }
+
+
+@contextmanager
+def span(name: str):
+    """记录当前追踪中的一个阶段，没有追踪时不做任何事"""
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_span(name, start, time.perf_counter())
+
+
+class Tracer:
+    """
+    请求追踪记录器
+    慢请求和按比例抽样的请求写入 JSONL 文件，最近的追踪保留在内存中用于查看最慢请求
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        slow_threshold: float = 3.0,
+        sample_rate: float = 0.0,
+        recent: int = 200,
+        max_file_bytes: int = 5 * 1024 * 1024,
+    ):
+        self.path = Path(path)
+        self.slow_threshold = slow_threshold
+        self.sample_rate = sample_rate
+        self.max_file_bytes = max_file_bytes
+        self.recent: Deque[dict] = deque(maxlen=recent)
+
+    def start(self, command: str, **attrs) -> Trace:
+        """开始追踪，调用方需通过 current_trace 设置为当前协程的追踪"""
+        return Trace(command, **attrs)
+
+    def finish(self, trace: Trace) -> Optional[dict]:
+        """
+        结束追踪
+        :return: 需要写入文件的记录，不需要写入时返回 None
+        """
+        trace.finish()
+        record = trace.to_dict()
+        self.recent.append(record)
+        if trace.active_duration >= self.slow_threshold or random.random() < self.sample_rate:
+            return record
+        return None
+
+    def write(self, record: dict):
+        """追加写入 JSONL 文件，超过大小上限时轮换（阻塞操作，应在线程中执行）"""
+        try:
+            if self.path.stat().st_size > self.max_file_bytes:
+                os.replace(self.path, self.path.with_suffix(".jsonl.1"))
+        except FileNotFoundError:
+            pass
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def slowest(self, n: int = 5) -> List[dict]:
+        """最近请求中处理耗时最长的 n 个"""
+        return sorted(self.recent, key=lambda record: record["active"], reverse=True)[:n]
@@ -0,0 +1,209 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from pathlib import Path
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+# 调用栈中优先定位到插件自身的代码
+PLUGIN_DIR = str(Path(__file__).resolve().parent.parent)
+
+
+class LoopWatchdog:
+    """
+    事件循环看门狗
+    循环内的心跳协程按固定间隔唤醒，实际唤醒时间与预期的差值即事件循环延迟；
+    独立的监视线程发现心跳停止超过阈值时，采集事件循环线程的调用栈，统计阻塞事件循环的代码位置。
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.1,
+        interval: float = 0.05,
+        stack_depth: int = 12,
+        max_locations: int = 50,
+        on_block: Optional[Callable[[float, str], None]] = None,
+        log_interval: float = 60,
+        plugin_only: bool = True,
+    ):
+        """
+        :param threshold: 心跳停止超过该时间（秒）视为阻塞
+        :param interval: 心跳间隔（秒）
+        :param on_block: 阻塞结束时的回调 (阻塞时长, 调用栈文本)，在监视线程中调用；同一位置每 log_interval 秒最多回调一次
+        :param plugin_only: 只对调用栈中有插件代码的阻塞回调，其他插件或框架造成的阻塞只计入统计
+        """
+        self.threshold = threshold
+        self.interval = interval
+        self.stack_depth = stack_depth
+        self.max_locations = max_locations
+        self.on_block = on_block
+        self.log_interval = log_interval
+        self.plugin_only = plugin_only
+
+        # 事件循环延迟（秒）
+        self.lag_mean = 0.0
+        self.lag_max = 0.0
+        self._lags: Deque[float] = deque(maxlen=1200)
+        # 阻塞统计
+        self.blocks = 0
+        self.blocked_time = 0.0
+        # 代码位置 -> {"samples", "blocks", "max", "stack"}
+        self.locations: Dict[str, dict] = {}
+        self._last_logged: Dict[str, float] = {}
+
+        self._beat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """在事件循环中启动心跳协程和监视线程（只启动一次）"""
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        if hasattr(sys, "_current_frames"):
+            self._thread = threading.Thread(target=self._monitor, name="ikun-music-watchdog", daemon=True)
+            self._thread.start()
+
+    async def close(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join, 1)
+            self._thread = None
+
+    async def _heartbeat(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - start - self.interval, 0.0)
+            self._lags.append(lag)
+            self.lag_mean += 0.05 * (lag - self.lag_mean)
+            self.lag_max = max(self.lag_max, lag)
+
+    @staticmethod
+    def _locate(frames: List[traceback.FrameSummary]) -> Tuple[str, bool]:
+        """阻塞位置：最内层的插件代码，调用栈中没有插件代码时取最内层的帧；返回 (位置, 是否为插件代码)"""
+        for frame in reversed(frames):
+            if frame.filename.startswith(PLUGIN_DIR):
+                in_plugin = True
+                break
+        else:
+            frame, in_plugin = frames[-1], False
+        return f"{Path(frame.filename).name}:{frame.lineno} {frame.name}", in_plugin
+
+    def _sample(self) -> Optional[Tuple[str, str, bool]]:
+        """采集事件循环线程的调用栈，返回 (位置, 调用栈文本, 是否为插件代码)"""
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return None
+        frames = traceback.extract_stack(frame)
+        # 去掉事件循环自身的调用帧，只保留被执行的回调
+        for i in range(len(frames) - 1, -1, -1):
+            if frames[i].name == "_run" and frames[i].filename.endswith(("asyncio/events.py", "asyncio\\events.py")):
+                frames = frames[i + 1:]
+                break
+        frames = traceback.StackSummary.from_list(frames[-self.stack_depth:])
+        if not frames:
+            return None
+        location, in_plugin = self._locate(frames)
+        return location, "".join(traceback.format_list(frames)), in_plugin
+
+    def _monitor(self):
+        """监视线程：心跳停止超过阈值时按固定间隔采样调用栈，阻塞结束后记录时长"""
+        poll = max(self.threshold / 2, 0.01)
+        episode_beat = None
+        first_sample = None
+        while not self._stop.wait(poll):
+            beat = self._beat
+            stalled = time.monotonic() - beat - self.interval
+            if stalled >= self.threshold:
+                sample = self._sample()
+                if sample is None:
+                    continue
+                with self._lock:
+                    location = self.locations.get(sample[0])
+                    if location is None:
+                        if len(self.locations) >= self.max_locations:
+                            # 丢弃采样最少的位置
+                            del self.locations[min(self.locations, key=lambda key: self.locations[key]["samples"])]
+                        location = self.locations[sample[0]] = {"samples": 0, "blocks": 0, "max": 0.0, "stack": sample[1]}
+                    location["samples"] += 1
+                if episode_beat != beat:
+                    episode_beat, first_sample = beat, sample
+            elif episode_beat is not None and beat != episode_beat:
+                # 心跳恢复，本次阻塞结束
+                self._finish_episode(beat - episode_beat - self.interval, first_sample)
+                episode_beat = first_sample = None
+
+    def _finish_episode(self, duration: float, sample: Tuple[str, str, bool]):
+        key, stack, in_plugin = sample
+        with self._lock:
+            self.blocks += 1
+            self.blocked_time += duration
+            location = self.locations.get(key)
+            if location is not None:
+                location["blocks"] += 1
+                location["max"] = max(location["max"], duration)
+        if self.plugin_only and not in_plugin:
+            return
+        now = time.monotonic()
+        if self.on_block and now - self._last_logged.get(key, -self.log_interval) >= self.log_interval:
+            self._last_logged[key] = now
+            try:
+                self.on_block(duration, stack)
+            except Exception as e:
+                print(f"看门狗回调出错: {e}")
+
+    def stats(self, top: int = 5) -> dict:
+        lags = sorted(self._lags)
+        with self._lock:
+            locations = sorted(self.locations.items(), key=lambda item: item[1]["samples"], reverse=True)[:top]
+            return {
+                "lag_mean": self.lag_mean,
+                "lag_p99": lags[min(int(len(lags) * 0.99), len(lags) - 1)] if lags else 0.0,
+                "lag_max": self.lag_max,
+                "blocks": self.blocks,
+                "blocked_time": self.blocked_time,
+                "locations": [
+                    {"location": key, "samples": item["samples"], "blocks": item["blocks"], "max": item["max"]}
+                    for key, item in locations
+                ],
+            }
+
+
+# 示例测试方法：模拟阻塞调用并输出看门狗统计
+async def main():
+    def on_block(duration, stack):
+        print(f"事件循环被阻塞 {duration * 1000:.0f} ms，调用栈：\n{stack}")
+
+    watchdog = LoopWatchdog(threshold=0.05, on_block=on_block)
+    watchdog.start()
+    await asyncio.sleep(0.3)
+    for _ in range(3):
+        time.sleep(0.2)
+        await asyncio.sleep(0.2)
+    sum(i * i for i in range(3_000_000))
+    await asyncio.sleep(0.2)
+    await watchdog.close()
+    stats = watchdog.stats()
+    print(
+        f"延迟 平均 {stats['lag_mean'] * 1000:.1f} ms，p99 {stats['lag_p99'] * 1000:.1f} ms，"
+        f"最大 {stats['lag_max'] * 1000:.1f} ms；阻塞 {stats['blocks']} 次，共 {stats['blocked_time']:.2f} s"
+    )
+    for item in stats["locations"]:
+        print(f"  {item['location']}：采样 {item['samples']}，阻塞 {item['blocks']} 次，最长 {item['max'] * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())